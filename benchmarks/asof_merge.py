@@ -0,0 +1,69 @@
+"""
+Compare the Patrimonio series built with concat + pivot_table + bfill (the previous
+Home page pipeline) against the sorted as-of alignment of dataframes.timeseries.
+
+Run from the repository root:
+    python -m benchmarks.asof_merge --movimenti 1000000 --ordini 50000
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from dataframes.timeseries import asof_align
+
+
+def synthetic_operations(size: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp('2000-01-01') + pd.to_timedelta(np.sort(rng.integers(0, 9000, size)), unit='D')
+    return pd.DataFrame({'data_operazione': dates, 'importo': np.round(rng.normal(0, 500, size), 2)})
+
+
+def pivot_pipeline(ordini_df: pd.DataFrame, movimenti_df: pd.DataFrame) -> pd.Series:
+    investimenti_cum = -ordini_df['importo'].cumsum()
+    liquidita_cum = movimenti_df['importo'].cumsum()
+    all_dates = pd.concat([
+        pd.DataFrame({'Date': ordini_df['data_operazione'], 'Type': 'Investimenti', 'Value': investimenti_cum}),
+        pd.DataFrame({'Date': movimenti_df['data_operazione'], 'Type': 'Liquidita', 'Value': liquidita_cum})
+    ])
+    pivot_df = all_dates.pivot_table(index='Date', columns='Type', values='Value', aggfunc='last')
+    pivot_df = pivot_df.bfill()
+    return pivot_df['Investimenti'] + pivot_df['Liquidita']
+
+
+def asof_pipeline(ordini_df: pd.DataFrame, movimenti_df: pd.DataFrame) -> pd.Series:
+    aligned = asof_align({
+        'investimenti': pd.Series(-ordini_df['importo'].cumsum().values, index=ordini_df['data_operazione']),
+        'liquidita': pd.Series(movimenti_df['importo'].cumsum().values, index=movimenti_df['data_operazione']),
+    })
+    return aligned['investimenti'] + aligned['liquidita']
+
+
+def measure(function, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    function(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1024 ** 2
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--movimenti', type=int, default=1_000_000)
+    parser.add_argument('--ordini', type=int, default=50_000)
+    args = parser.parse_args()
+
+    movimenti_df = synthetic_operations(args.movimenti, seed=1)
+    ordini_df = synthetic_operations(args.ordini, seed=2)
+    print(f"{'pipeline':<12} {'time (s)':>10} {'peak (MiB)':>12}")
+    for name, function in (('pivot+bfill', pivot_pipeline), ('as-of', asof_pipeline)):
+        elapsed, peak = measure(function, ordini_df, movimenti_df)
+        print(f'{name:<12} {elapsed:>10.3f} {peak:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
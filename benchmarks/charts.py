@@ -0,0 +1,77 @@
+"""
+Compare the payload and the server side render time of the Home balances chart drawn
+with every point against the LTTB downsampled chart of components.charts, and against
+the cached figure served on reruns.
+
+The render time is the time to build the figure and serialize it to the JSON sent to
+the browser, which is what st.plotly_chart does on every rerun.
+
+Run from the repository root:
+    python -m benchmarks.charts --points 100000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from components.charts import cached_figure, line_trace, target_points
+
+COLUMNS = ('investimenti', 'liquidita', 'totale')
+
+
+def synthetic_saldi(size: int, seed: int = 1) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    saldi_df = pd.DataFrame({'data': pd.date_range('1990-01-01', periods=size, freq='h')})
+    saldi_df['investimenti'] = rng.normal(0, 100, size).cumsum()
+    saldi_df['liquidita'] = rng.normal(0, 100, size).cumsum()
+    saldi_df['totale'] = saldi_df['investimenti'] + saldi_df['liquidita']
+    return saldi_df
+
+
+def full_figure(saldi_df: pd.DataFrame) -> go.Figure:
+    fig = go.Figure()
+    for column in COLUMNS:
+        fig.add_trace(go.Scatter(x=saldi_df['data'], y=saldi_df[column], mode='lines', name=column))
+    return fig
+
+
+def downsampled_figure(saldi_df: pd.DataFrame, max_points: int) -> go.Figure:
+    fig = go.Figure()
+    for column in COLUMNS:
+        fig.add_trace(line_trace(saldi_df['data'], saldi_df[column], max_points, mode='lines', name=column))
+    return fig
+
+
+def measure(build, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        payload = build().to_json()
+        timings.append(time.perf_counter() - start)
+    return min(timings), len(payload.encode())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--points', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    saldi_df = synthetic_saldi(args.points)
+    max_points = target_points()
+    cached = cached_figure('benchmark')(lambda: downsampled_figure(saldi_df, max_points))
+    cached()
+
+    print(f'{args.points} points per trace, downsampled to {max_points}')
+    print(f"{'figure':<12} {'render (s)':>11} {'payload (KiB)':>14}")
+    for name, build in (('full', lambda: full_figure(saldi_df)),
+                        ('lttb', lambda: downsampled_figure(saldi_df, max_points)),
+                        ('cached', cached)):
+        elapsed, size = measure(build, args.repeat)
+        print(f'{name:<12} {elapsed:>11.3f} {size / 1024:>14.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Compare the conversion of an adapted movimenti dataframe to insert parameters:
+the row by row ORM construction (iterrows) against the column oriented conversion.
+
+Run from the repository root:
+    python -m benchmarks.dataframe_to_sql --sizes 10000 100000 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from sql.models.movimenti import MovimentiModel
+from sql.utils import dataframe_to_params
+
+
+def synthetic_movimenti(size: int) -> pd.DataFrame:
+    rng = np.random.default_rng(42)
+    dates = pd.Timestamp('2015-01-01') + pd.to_timedelta(rng.integers(0, 3650, size), unit='D')
+    importo = np.round(rng.normal(0, 500, size), 2)
+    importo[rng.random(size) < 0.01] = np.nan
+    return pd.DataFrame({
+        'data_operazione': dates,
+        'data_valuta': dates,
+        'descrizione': rng.choice(['Bonifico SEPA', 'Pagamento POS', 'Imposta bollo'], size),
+        'descrizione_completa': [f'Movimento n. {i}' for i in range(size)],
+        'importo': importo,
+    })
+
+
+def iterrows_to_orm(df: pd.DataFrame):
+    return [MovimentiModel(**row.to_dict()) for _, row in df.iterrows()]
+
+
+def columns_to_params(df: pd.DataFrame):
+    return dataframe_to_params(df, MovimentiModel.__table__)
+
+
+def timed(function, df: pd.DataFrame) -> float:
+    start = time.perf_counter()
+    function(df)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', nargs='+', type=int, default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'iterrows+ORM (s)':>18} {'columnar (s)':>14} {'speedup':>9}")
+    for size in args.sizes:
+        df = synthetic_movimenti(size)
+        orm_time = timed(iterrows_to_orm, df)
+        columnar_time = timed(columns_to_params, df)
+        print(f'{size:>10} {orm_time:>18.3f} {columnar_time:>14.3f} {orm_time / columnar_time:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
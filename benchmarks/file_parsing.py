@@ -0,0 +1,81 @@
+"""
+Compare the previous convert_file_to_table, which read the whole export twice and looked
+for the header with iterrows, against the single pass reader and the chunk iterator of
+sql.utils, on a synthetic Fineco movements export.
+
+Run from the repository root:
+    python -m benchmarks.file_parsing --rows 100000 --format xlsx
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+from benchmarks.fineco_exports import MOVIMENTI_TITLE, iter_movimenti_export, write_export
+from sql.utils import convert_file_to_table, iter_file_chunks
+
+
+def synthetic_export(path: str, rows: int, seed: int = 1):
+    write_export(path, iter_movimenti_export(rows, seed), MOVIMENTI_TITLE)
+
+
+def previous_convert(file_path):
+    read = pd.read_csv if file_path.endswith('.csv') else pd.read_excel
+    df = read(file_path, header=None)
+    num_cols = len(df.columns)
+    idx = 0
+    for idx, row in df.iterrows():
+        if row.notna().sum() == num_cols:
+            break
+    df = read(file_path, skiprows=idx)
+    df = df.dropna(how='all')
+    df.columns = df.columns.str.strip()
+    return df
+
+
+def chunked_convert(file_path):
+    rows = 0
+    for chunk in iter_file_chunks(file_path, chunksize=20000):
+        rows += len(chunk)
+    return rows
+
+
+def measure(function, *args):
+    # tracemalloc slows openpyxl down several times: time and memory are measured in two runs
+    start = time.perf_counter()
+    function(*args)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    function(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1024 ** 2
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--format', choices=['xlsx', 'csv'], default='xlsx')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, f'movimenti.{args.format}')
+        synthetic_export(path, args.rows)
+        print(f'{args.rows} rows, {os.path.getsize(path) / 1024 ** 2:.1f} MiB {args.format}')
+        print(f"{'reader':<12} {'time (s)':>10} {'peak (MiB)':>12}")
+        for name, function in (('previous', previous_convert), ('single pass', convert_file_to_table),
+                               ('chunked', chunked_convert)):
+            try:
+                elapsed, peak = measure(function, path)
+            except Exception as e:
+                tracemalloc.stop()
+                print(f'{name:<12} failed: {e}')
+                continue
+            print(f'{name:<12} {elapsed:>10.3f} {peak:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
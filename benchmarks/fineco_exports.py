@@ -0,0 +1,220 @@
+"""
+Write synthetic Fineco exports of titoli, ordini and movimenti in the layouts of the bank:
+title rows above the header, Italian dates, Entrate and Uscite in separate columns. File
+names follow INGEST_ROUTES, so the exports can be uploaded or dropped in the --data-path
+directory as they are.
+
+Rows are generated and written in chunks, so exports of millions of rows do not need to fit
+in memory. xlsx sheets hold at most 1048576 rows, larger exports must be csv.
+
+Run from the repository root:
+    python -m benchmarks.fineco_exports exports --rows 100000 --format csv
+"""
+import argparse
+import os
+from typing import Dict, Iterable, Iterator, List
+
+import numpy as np
+import pandas as pd
+
+XLSX_MAX_ROWS = 1_048_576
+CHUNKSIZE = 100_000
+FIRST_DAY = pd.Timestamp('2005-01-01')
+LAST_DAY = pd.Timestamp('2024-12-31')
+
+MOVIMENTI_TITLE = [['Risultati ricerca movimenti'], ['Conto corrente: 0000000'],
+                   [f"Periodo: {FIRST_DAY:%d/%m/%Y} - {LAST_DAY:%d/%m/%Y}"], []]
+ORDINI_TITLE = [['Lista Titoli'], ['Dossier: 0000000'], []]
+TITOLI_TITLE = [['Portafoglio titoli'], [f'Situazione al {LAST_DAY:%d/%m/%Y}'], []]
+
+MOVIMENTI_DESCRIZIONI = {
+    'Pagamento Visa Debit': 'Pagamento Visa Debit presso {} carta n. ****0000',
+    'Bonifico SEPA Italia': 'Bonifico SEPA Italia da {} causale stipendio',
+    'Addebito SDD': 'Addebito diretto SDD {} mandato n. 0000',
+    'Imposta bollo conto corrente': 'Imposta di bollo conto corrente {}',
+    'Compravendita Titoli': 'Compravendita titoli {}',
+    'Stacco cedole': 'Accredito cedola {}',
+    'Dividendo': 'Accredito dividendo {}',
+    'Interessi creditori': 'Interessi creditori {}',
+}
+CONTROPARTI = ['ESSELUNGA MILANO', 'AMAZON EU SARL', 'ENEL ENERGIA', 'ROSSI MARIO', 'TRENITALIA',
+               'COMUNE DI MILANO', 'FARMACIA CENTRALE', 'AUTOSTRADE PER L ITALIA']
+STRUMENTI = [('Azione', 'MTA'), ('ETF', 'ETFplus'), ('Obbligazione', 'MOT'), ('Fondo', 'FONDI')]
+COMMISSIONI = ['Commissioni Fondi Sw/Ingr/Uscita', 'Commissioni Fondi Banca Corrispondente',
+               'Spese Fondi Sgr', 'Commissioni amministrato']
+
+
+def _dates(rng: np.random.Generator, size: int) -> pd.DatetimeIndex:
+    days = (LAST_DAY - FIRST_DAY).days
+    return FIRST_DAY + pd.to_timedelta(np.sort(rng.integers(0, days, size)), unit='D')
+
+
+def titoli_export(size: int = 50, seed: int = 0) -> pd.DataFrame:
+    """
+    A portafoglio export: the securities held, with the position columns the adapter drops.
+
+    Args:
+        size: Number of securities
+        seed: Seed of the random generator, the ISINs depend on it
+    """
+    rng = np.random.default_rng(seed)
+    strumenti = [STRUMENTI[i] for i in rng.integers(0, len(STRUMENTI), size)]
+    return pd.DataFrame({
+        'Titolo': [f'{strumento.upper()} {i:03d}' for i, (strumento, _) in enumerate(strumenti)],
+        'ISIN': [f'IT{seed:02d}{i:08d}' for i in range(size)],
+        'Simbolo': [f'T{i:03d}' for i in range(size)],
+        'Mercato': [mercato for _, mercato in strumenti],
+        'Strumento': [strumento for strumento, _ in strumenti],
+        'Valuta': rng.choice(['EUR', 'EUR', 'EUR', 'USD'], size),
+        'Quantita': rng.integers(1, 500, size).astype(float),
+        'Prezzo medio di carico': np.round(rng.uniform(5, 150, size), 4),
+    })
+
+
+def iter_ordini_export(rows: int, isins: List[str], seed: int = 0,
+                       chunksize: int = CHUNKSIZE) -> Iterator[pd.DataFrame]:
+    """
+    A Lista Titoli export, chunk by chunk: buy and sell orders of the given securities.
+
+    Args:
+        rows: Number of orders
+        isins: ISINs of the securities, as in the titoli export
+        seed: Seed of the random generator
+        chunksize: Number of rows of each chunk
+    """
+    rng = np.random.default_rng(seed + 1)
+    dates = _dates(rng, rows)
+    for start in range(0, rows, chunksize):
+        size = min(chunksize, rows - start)
+        chunk_dates = dates[start:start + size]
+        quantita = rng.integers(1, 200, size).astype(float)
+        prezzo = np.round(rng.uniform(5, 150, size), 4)
+        commissioni = np.zeros((size, len(COMMISSIONI)))
+        commissioni[np.arange(size), rng.integers(0, len(COMMISSIONI), size)] = np.round(rng.uniform(0, 19, size), 2)
+        df = pd.DataFrame({
+            'Operazione': chunk_dates.strftime('%d/%m/%Y'),
+            'Data valuta': (chunk_dates + pd.Timedelta(days=2)).strftime('%d/%m/%Y'),
+            'Titolo': 'TITOLO',
+            'Isin': rng.choice(isins, size),
+            'Descrizione': [f'Ordine n. {start + i:09d}' for i in range(size)],
+            'Segno': rng.choice(['A', 'A', 'V'], size),
+            'Quantita': quantita,
+            'Divisa': 'EUR',
+            'Prezzo': prezzo,
+            'Cambio': 1.0,
+            'Controvalore': np.round(quantita * prezzo, 2),
+        })
+        for i, commissione in enumerate(COMMISSIONI):
+            df[commissione] = commissioni[:, i]
+        yield df
+
+
+def iter_movimenti_export(rows: int, seed: int = 0, chunksize: int = CHUNKSIZE) -> Iterator[pd.DataFrame]:
+    """
+    A movements export of the current account, chunk by chunk.
+
+    Args:
+        rows: Number of movements
+        seed: Seed of the random generator
+        chunksize: Number of rows of each chunk
+    """
+    rng = np.random.default_rng(seed + 2)
+    dates = _dates(rng, rows)
+    descrizioni = list(MOVIMENTI_DESCRIZIONI)
+    for start in range(0, rows, chunksize):
+        size = min(chunksize, rows - start)
+        chunk_dates = dates[start:start + size]
+        importi = np.round(rng.lognormal(3.5, 1.2, size) * rng.choice([-1, -1, -1, 1], size), 2)
+        descrizione = rng.choice(descrizioni, size)
+        controparte = rng.choice(CONTROPARTI, size)
+        yield pd.DataFrame({
+            'Data_Operazione': chunk_dates.strftime('%d/%m/%Y'),
+            'Data_Valuta': chunk_dates.strftime('%d/%m/%Y'),
+            'Entrate': np.where(importi > 0, importi, np.nan),
+            'Uscite': np.where(importi < 0, importi, np.nan),
+            'Descrizione': descrizione,
+            'Descrizione_Completa': [f'{MOVIMENTI_DESCRIZIONI[d].format(c)} rif. {start + i:09d}'
+                                     for i, (d, c) in enumerate(zip(descrizione, controparte))],
+            'Stato': 'Contabilizzato',
+        })
+
+
+def write_export(path: str, chunks: Iterable[pd.DataFrame], title_rows: List[List[str]]) -> int:
+    """
+    Write an export with its title rows above the header, as csv or xlsx after the extension.
+
+    Args:
+        path: File to write
+        chunks: The rows of the export, chunk by chunk
+        title_rows: Rows written above the header
+
+    Returns:
+        Number of rows written, header and title rows excluded
+    """
+    rows = 0
+    if path.endswith('.csv'):
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            for title in title_rows:
+                f.write(','.join(title) + '\n')
+            for chunk in chunks:
+                chunk.to_csv(f, header=rows == 0, index=False)
+                rows += len(chunk)
+        return rows
+
+    import openpyxl
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    for title in title_rows:
+        sheet.append(title)
+    for chunk in chunks:
+        if rows == 0:
+            sheet.append(list(chunk.columns))
+        if rows + len(chunk) + len(title_rows) + 1 > XLSX_MAX_ROWS:
+            raise ValueError(f'{path} would exceed the {XLSX_MAX_ROWS} rows of an xlsx sheet, write a csv')
+        for row in chunk.astype(object).where(chunk.notna(), None).itertuples(index=False):
+            sheet.append(row)
+        rows += len(chunk)
+    workbook.save(path)
+    return rows
+
+
+def write_exports(directory: str, rows: int, file_format: str = 'csv', seed: int = 0,
+                  titoli: int = 50) -> Dict[str, str]:
+    """
+    Write a titoli, an ordini and a movimenti export in directory.
+
+    Args:
+        directory: Directory of the exports, created if missing
+        rows: Number of ordini and of movimenti
+        file_format: 'csv' or 'xlsx'
+        seed: Seed of the random generator, exports with different seeds do not overlap
+        titoli: Number of securities
+
+    Returns:
+        The path of the export of each table
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = {table: os.path.join(directory, f'{name}_{seed}.{file_format}')
+             for table, name in (('titoli', 'portafoglio'), ('ordini', 'Lista Titoli'), ('movimenti', 'movements'))}
+    portafoglio = titoli_export(titoli, seed)
+    write_export(paths['titoli'], [portafoglio], TITOLI_TITLE)
+    write_export(paths['ordini'], iter_ordini_export(rows, list(portafoglio['ISIN']), seed), ORDINI_TITLE)
+    write_export(paths['movimenti'], iter_movimenti_export(rows, seed), MOVIMENTI_TITLE)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('directory')
+    parser.add_argument('--rows', type=int, default=100_000, help='rows of the ordini and movimenti exports')
+    parser.add_argument('--format', choices=['csv', 'xlsx'], default='csv')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for table, path in write_exports(args.directory, args.rows, args.format, args.seed).items():
+        print(f'{table:<10} {path} ({os.path.getsize(path) / 1024 ** 2:.1f} MiB)')
+
+
+if __name__ == '__main__':
+    main()
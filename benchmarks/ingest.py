@@ -0,0 +1,121 @@
+"""
+End to end ingest of synthetic Fineco exports: parsing (convert_file_to_table, or
+iter_file_chunks with --chunksize), adapting (the adapt_*_df of sql.ingest) and inserting
+(BasicDao.insert_dataframe) each table, with rows per second and peak memory of each stage.
+
+Peak memory is the largest increase of the resident set over the start of the stage,
+sampled in a background thread, so it includes the buffers allocated outside of the
+Python heap and does not slow the stages down as tracemalloc would.
+
+The rows are inserted for real, run it against a scratch database. Each size is generated
+with its own seed, so the exports of a run do not overlap:
+    POSTGRES_DB=bash_bench python -m benchmarks.ingest --rows 1000 100000 1000000 --format csv
+    POSTGRES_DB=bash_bench python -m benchmarks.ingest --rows 10000000 --chunksize 500000
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from benchmarks.fineco_exports import write_exports
+from benchmarks.read_path import current_rss_mib
+from sql.ingest import ADAPTERS, INGEST_ROUTES
+from sql.utils import convert_file_to_table, iter_file_chunks
+
+STAGES = ('parse', 'adapt', 'insert')
+
+
+class StageMeter:
+    """Accumulate the time and the peak resident memory increase of named stages."""
+
+    def __init__(self, interval: float = 0.005):
+        self.elapsed = defaultdict(float)
+        self.peak = defaultdict(float)
+        self._interval = interval
+        self._high = 0.0
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+
+    def _sample(self):
+        while not self._stop.wait(self._interval):
+            self._high = max(self._high, current_rss_mib())
+
+    @contextmanager
+    def stage(self, name: str):
+        baseline = self._high = current_rss_mib()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.elapsed[name] += time.perf_counter() - start
+            self._high = max(self._high, current_rss_mib())
+            self.peak[name] = max(self.peak[name], self._high - baseline)
+
+    def close(self):
+        self._stop.set()
+        self._sampler.join()
+
+
+def ingest_table(dao, path: str, table: str, meter: StageMeter, chunksize: int = 0) -> dict:
+    """Parse, adapt and insert one export, whole or chunk by chunk."""
+    if chunksize:
+        chunks = iter_file_chunks(path, chunksize)
+    else:
+        def whole_file():
+            yield convert_file_to_table(path)
+        chunks = whole_file()
+    totals = dict(rows=0, inserted=0, skipped=0, errors=0)
+    while True:
+        with meter.stage('parse'):
+            df = next(chunks, None)
+        if df is None:
+            return totals
+        with meter.stage('adapt'):
+            df = ADAPTERS[table](df)
+        with meter.stage('insert'):
+            results = dao.insert_dataframe(df)
+        totals['rows'] += len(df)
+        totals['inserted'] += results['success_count']
+        totals['skipped'] += results['skipped_count']
+        totals['errors'] += len(results['errors'])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', nargs='+', type=int, default=[1_000, 10_000, 100_000],
+                        help='rows of the ordini and movimenti exports')
+    parser.add_argument('--format', choices=['csv', 'xlsx'], default='csv')
+    parser.add_argument('--chunksize', type=int, default=0, help='parse and insert in chunks of this many rows')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first size, the next ones follow')
+    args = parser.parse_args()
+
+    from sql.dao_list import MOVIMENTI_DAO, ORDINI_DAO, TITOLI_DAO
+    from sql.schema import create_schema
+
+    create_schema()
+    daos = {dao.table_name: dao for dao in (TITOLI_DAO, ORDINI_DAO, MOVIMENTI_DAO)}
+    print(f"{'rows':>10} {'table':<10} {'MiB':>7} {'inserted':>9} {'skipped':>8} "
+          + ' '.join(f"{stage + ' rows/s':>13} {stage + ' MiB':>11}" for stage in STAGES))
+    for seed, rows in enumerate(args.rows, start=args.seed):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = write_exports(directory, rows, args.format, seed)
+            for table, _, _ in INGEST_ROUTES:
+                meter = StageMeter()
+                try:
+                    totals = ingest_table(daos[table], paths[table], table, meter, args.chunksize)
+                finally:
+                    meter.close()
+                size = os.path.getsize(paths[table]) / 1024 ** 2
+                print(f"{rows:>10} {table:<10} {size:>7.1f} {totals['inserted']:>9} {totals['skipped']:>8} "
+                      + ' '.join(f"{totals['rows'] / meter.elapsed[stage]:>13,.0f} {meter.peak[stage]:>11.1f}"
+                                 for stage in STAGES))
+                if totals['errors']:
+                    print(f"{'':>10} {table:<10} {totals['errors']} rows could not be inserted")
+
+
+if __name__ == '__main__':
+    main()
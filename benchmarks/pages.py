@@ -0,0 +1,138 @@
+"""
+Render the dashboard pages headless with Streamlit AppTest and check them against budgets:
+wall time, SQL queries, rows fetched and size of the elements sent to the browser, per rerun.
+
+The first rerun of each page starts with an empty query cache, the next ones are served by
+it. Exits with status 1 when a rerun exceeds a budget of its page, so it can gate changes.
+
+Budgets default to PAGE_BUDGETS and can be overridden per page with a JSON file of the same
+shape. Run from the repository root, against a scratch database seeded with synthetic
+exports, or against a database with data without --seed-rows:
+    POSTGRES_DB=bash_bench python -m benchmarks.pages --seed-rows 100000 --budgets budgets.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from sqlalchemy import event
+
+from benchmarks.fineco_exports import write_exports
+from sql.cache import QUERY_CACHE
+from sql.manager import DBInstance
+
+PAGES = ('pages/home.py', 'pages/movimenti.py', 'pages/azioni.py', 'pages/imposte.py')
+# About twice the cold reruns measured with --seed-rows 100000
+PAGE_BUDGETS = {
+    'pages/home.py': dict(time_s=1.0, queries=10, rows=20_000, payload_kib=512),
+    'pages/movimenti.py': dict(time_s=2.0, queries=10, rows=50_000, payload_kib=4096),
+    'pages/azioni.py': dict(time_s=1.0, queries=10, rows=5_000, payload_kib=256),
+    'pages/imposte.py': dict(time_s=1.5, queries=10, rows=30_000, payload_kib=512),
+}
+
+
+class QueryCounter:
+    """Count the statements run on an engine and the rows they returned."""
+
+    def __init__(self, engine):
+        self.queries = 0
+        self.rows = 0
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+
+    def _after_execute(self, connection, cursor, statement, parameters, context, executemany):
+        self.queries += 1
+        if cursor.description is not None and cursor.rowcount > 0:
+            self.rows += cursor.rowcount
+
+    def reset(self):
+        self.queries = self.rows = 0
+
+
+def payload_size(node) -> int:
+    """Serialized size in bytes of the elements of an AppTest tree."""
+    proto = getattr(node, 'proto', None)
+    size = proto.ByteSize() if hasattr(proto, 'ByteSize') else 0
+    return size + sum(payload_size(child) for child in getattr(node, 'children', {}).values())
+
+
+def seed_database(rows: int, seed: int = 0):
+    """Ingest synthetic exports of the given number of ordini and movimenti."""
+    from sql.ingest import ingest_files
+    from sql.schema import create_schema
+
+    create_schema()
+
+    with tempfile.TemporaryDirectory() as directory:
+        files = []
+        for path in write_exports(directory, rows, 'csv', seed).values():
+            with open(path, 'rb') as f:
+                files.append((os.path.basename(path), f.read()))
+        for summary in ingest_files(files):
+            print(f"seeded {summary['tabella']}: {summary['inseriti']} rows, {summary['esito']}")
+
+
+def render_pages(pages: List[str], reruns: int, timeout: float) -> List[Dict]:
+    """Render each page reruns times, the first one with an empty query cache."""
+    from streamlit.testing.v1 import AppTest
+
+    counter = QueryCounter(DBInstance().engine)
+    # main.py parses the command line, which here holds the arguments of the benchmark
+    argv, sys.argv = sys.argv, ['main.py']
+    try:
+        app = AppTest.from_file('main.py', default_timeout=timeout)
+        app.run()
+        measures = []
+        for page in pages:
+            QUERY_CACHE.clear()
+            for rerun in range(reruns):
+                counter.reset()
+                start = time.perf_counter()
+                (app.switch_page(page) if rerun == 0 else app).run()
+                measures.append(dict(page=page, rerun='cold' if rerun == 0 else 'warm',
+                                     time_s=time.perf_counter() - start, queries=counter.queries,
+                                     rows=counter.rows, payload_kib=payload_size(app._tree) / 1024,
+                                     exceptions=[e.message for e in app.exception]))
+        return measures
+    finally:
+        sys.argv = argv
+
+
+def over_budget(measure: Dict, budgets: Dict[str, Dict]) -> List[str]:
+    budget = budgets.get(measure['page'], {})
+    return [f'{name} {measure[name]:.4g} > {limit}' for name, limit in budget.items() if measure[name] > limit]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', nargs='+', default=list(PAGES))
+    parser.add_argument('--reruns', type=int, default=3, help='reruns per page, the first one with a cold cache')
+    parser.add_argument('--budgets', help='JSON file of budgets per page, overriding PAGE_BUDGETS')
+    parser.add_argument('--seed-rows', type=int, default=0, help='ingest synthetic exports of this many rows first')
+    parser.add_argument('--timeout', type=float, default=120, help='seconds allowed to a single rerun')
+    args = parser.parse_args()
+
+    budgets = {page: dict(budget) for page, budget in PAGE_BUDGETS.items()}
+    if args.budgets:
+        with open(args.budgets) as f:
+            for page, budget in json.load(f).items():
+                budgets.setdefault(page, {}).update(budget)
+    if args.seed_rows:
+        seed_database(args.seed_rows)
+
+    failures = 0
+    print(f"{'page':<22} {'rerun':<5} {'time (s)':>9} {'queries':>8} {'rows':>9} {'payload (KiB)':>14}")
+    for measure in render_pages(args.pages, args.reruns, args.timeout):
+        problems = over_budget(measure, budgets) + [f'exception: {e}' for e in measure['exceptions']]
+        failures += bool(problems)
+        print(f"{measure['page']:<22} {measure['rerun']:<5} {measure['time_s']:>9.3f} {measure['queries']:>8} "
+              f"{measure['rows']:>9} {measure['payload_kib']:>14.1f} {'; '.join(problems)}")
+    if failures:
+        print(f'{failures} reruns failed or over budget')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Compare the readers of BasicDao.get_all(as_dataframe=True) on a whole table: rows per
+second and peak memory. Each reader runs in its own process, so the peak resident memory
+includes what Arrow allocates outside of the Python heap.
+
+Run from the repository root, against a database with data:
+    python -m benchmarks.read_path --table movimenti
+"""
+import argparse
+import resource
+import subprocess
+import sys
+import time
+
+READERS = ('sql', 'copy', 'arrow')
+
+
+def current_rss_mib() -> float:
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * resource.getpagesize() / 1024 ** 2
+
+
+def run_reader(table: str, reader: str):
+    from sql import dao_list
+
+    dao = getattr(dao_list, f'{table.upper()}_DAO')
+    baseline = current_rss_mib()
+    start = time.perf_counter()
+    df = dao.get_all(as_dataframe=True, reader=reader)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 - baseline
+    print(f'{reader:<8} {len(df):>10} {elapsed:>10.3f} {len(df) / elapsed:>12.0f} {peak:>12.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--table', default='movimenti')
+    parser.add_argument('--reader', choices=READERS)
+    args = parser.parse_args()
+
+    if args.reader:
+        run_reader(args.table, args.reader)
+        return
+    print(f"{'reader':<8} {'rows':>10} {'time (s)':>10} {'rows/s':>12} {'peak (MiB)':>12}")
+    for reader in READERS:
+        subprocess.run([sys.executable, '-m', 'benchmarks.read_path', '--table', args.table, '--reader', reader],
+                       check=True, stderr=subprocess.DEVNULL)
+
+
+if __name__ == '__main__':
+    main()
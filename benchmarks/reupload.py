@@ -0,0 +1,64 @@
+"""
+Time the upload of an export overlapping the data already loaded: a full year of movimenti
+of which only the last few days are new, on top of tables of growing size.
+
+The rows are inserted for real, run it against a scratch database:
+    POSTGRES_DB=bash_bench python -m benchmarks.reupload --history 100000 1000000
+"""
+import argparse
+import time
+
+import pandas as pd
+
+from benchmarks.dataframe_to_sql import synthetic_movimenti
+from sql.dao_list import MOVIMENTI_DAO
+from sql.schema import create_schema
+
+YEAR_DAYS = 365
+
+
+def movimenti(size: int) -> pd.DataFrame:
+    # importo is required, the rows without it would be reported as errors
+    return synthetic_movimenti(size).dropna(subset=['importo']).reset_index(drop=True)
+
+
+def overlapping_export(history: pd.DataFrame, new_days: int, run: int) -> pd.DataFrame:
+    """The last year of history followed by new_days days of new operations."""
+    last_day = history['data_operazione'].max()
+    export = history.loc[history['data_operazione'] > last_day - pd.Timedelta(days=YEAR_DAYS)]
+    new = movimenti(new_days * 10)
+    new['data_operazione'] = new['data_valuta'] = (
+        last_day + pd.to_timedelta(run * new_days + 1 + new.index % new_days, unit='D'))
+    new['descrizione_completa'] = [f'Nuovo movimento {run}.{i}' for i in range(len(new))]
+    return pd.concat([export, new], ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--history', nargs='+', type=int, default=[100_000, 1_000_000],
+                        help='rows loaded before the re-upload, cumulative')
+    parser.add_argument('--new-days', type=int, default=3)
+    parser.add_argument('--methods', nargs='+', default=['copy', 'core'])
+    args = parser.parse_args()
+
+    create_schema()
+    print(f"{'history':>10} {'method':>7} {'export':>8} {'inserted':>9} {'skipped':>8} {'time (s)':>9}")
+    loaded = 0
+    run = 0
+    for size in args.history:
+        if size > loaded:
+            MOVIMENTI_DAO.insert_dataframe(movimenti(size).iloc[loaded:], method='copy')
+            loaded = size
+        history = MOVIMENTI_DAO.get_all(as_dataframe=True, reader='copy')
+        for method in args.methods:
+            export = overlapping_export(history, args.new_days, run)
+            run += 1
+            start = time.perf_counter()
+            results = MOVIMENTI_DAO.insert_dataframe(export, method=method)
+            elapsed = time.perf_counter() - start
+            print(f"{len(history):>10} {method:>7} {len(export):>8} {results['success_count']:>9} "
+                  f"{results['skipped_count']:>8} {elapsed:>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
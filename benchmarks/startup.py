@@ -0,0 +1,70 @@
+"""
+Measure the startup of the dashboard, each measure in a fresh interpreter:
+    first paint: from the start of the process to the end of the first run of main.py,
+        which renders the home page, with Streamlit AppTest
+    page imports: time to run the top level imports of each page, and modules loaded
+
+Run from the repository root, against a database with the schema:
+    python -m benchmarks.startup --repeat 5
+"""
+import argparse
+import ast
+import glob
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+START = time.perf_counter()
+
+
+def page_imports(page: str) -> dict:
+    with open(page) as f:
+        tree = ast.parse(f.read())
+    imports = ast.Module([node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))], [])
+    modules = len(sys.modules)
+    start = time.perf_counter()
+    exec(compile(imports, page, 'exec'), {'__name__': 'page_imports'})
+    return dict(seconds=time.perf_counter() - start, modules=len(sys.modules) - modules)
+
+
+def first_paint() -> dict:
+    from streamlit.testing.v1 import AppTest
+
+    # main.py parses the command line, which here holds the arguments of the benchmark
+    sys.argv = ['main.py']
+    app = AppTest.from_file('main.py', default_timeout=120)
+    app.run()
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+    return dict(seconds=time.perf_counter() - START, modules=len(sys.modules))
+
+
+def run_child(*args: str) -> dict:
+    result = subprocess.run([sys.executable, '-m', 'benchmarks.startup', '--child', *args], check=True,
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=3, help='runs of each measure, the median is reported')
+    parser.add_argument('--pages', nargs='+', default=sorted(glob.glob('pages/*.py')))
+    parser.add_argument('--child', nargs='+', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        measure = first_paint() if args.child[0] == 'first-paint' else page_imports(args.child[1])
+        print(json.dumps(measure))
+        return
+
+    print(f"{'measure':<28} {'time (s)':>9} {'modules':>8}")
+    for name, child in [('first paint', ['first-paint'])] + [(page, ['imports', page]) for page in args.pages]:
+        runs = [run_child(*child) for _ in range(args.repeat)]
+        print(f"{name:<28} {statistics.median(run['seconds'] for run in runs):>9.3f} "
+              f"{statistics.median(run['modules'] for run in runs):>8.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,22 @@
+import argparse
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """
+    Parse the options of the dashboard, given after -- to streamlit run:
+        streamlit run main.py -- --data-path ./data --profile
+
+    Unknown options are ignored, so that the pages, which run with the same command line,
+    and tools running main.py with their own options can parse it too.
+
+    Args:
+        argv: The options to parse, sys.argv by default
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data-path', default='./data', help='path to csv file containing bank incomes and expenses')
+    parser.add_argument('--watch', action='store_true', help='keep importing the new files of --data-path')
+    parser.add_argument('--watch-interval', type=float, default=60, help='seconds between two scans of --data-path')
+    parser.add_argument('--profile', action='store_true', help='profile each page rerun and show the hot functions')
+    parser.add_argument('--profile-dir', default='./profiles', help='directory of the profiles written by --profile')
+    args, _ = parser.parse_known_args(argv)
+    return args
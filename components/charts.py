@@ -0,0 +1,77 @@
+import os
+from functools import wraps
+from typing import Union
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+from pandas.api.types import is_datetime64_any_dtype, is_numeric_dtype
+
+from dataframes.timeseries import lttb_indices
+from sql.cache import QUERY_CACHE, cache_key
+
+# Width in pixels assumed for a full width chart, the browser width is not known server side
+CHART_WIDTH = int(os.getenv('CHART_WIDTH_PX', 1200))
+# Traces with more points than this are drawn with WebGL
+WEBGL_THRESHOLD = int(os.getenv('CHART_WEBGL_THRESHOLD', 1000))
+
+
+def target_points(width_ratio: float = 1.0, points_per_pixel: float = 1.0) -> int:
+    """
+    Number of points worth sending for a chart: more than one point per pixel is not visible.
+
+    Args:
+        width_ratio: Fraction of the page width taken by the chart, e.g. 2/3 inside st.columns([2, 1])
+        points_per_pixel: Points kept for each horizontal pixel
+
+    Returns:
+        The target number of points of each trace
+    """
+    return max(int(CHART_WIDTH * width_ratio * points_per_pixel), 3)
+
+
+def line_trace(x, y, max_points: int, **kwargs) -> Union[go.Scatter, go.Scattergl]:
+    """
+    Build a line trace downsampled with LTTB to max_points, drawn with WebGL above WEBGL_THRESHOLD points.
+
+    Args:
+        x: Sorted x values, numbers or dates
+        y: Numeric y values
+        max_points: Maximum number of points of the trace
+        kwargs: Any other go.Scatter argument
+
+    Returns:
+        A go.Scatter or go.Scattergl trace
+    """
+    x = pd.Series(x).reset_index(drop=True)
+    y = pd.Series(y).reset_index(drop=True)
+    if is_numeric_dtype(x):
+        numeric_x = x.to_numpy(dtype=float)
+    else:
+        x = x if is_datetime64_any_dtype(x) else pd.to_datetime(x)
+        numeric_x = x.to_numpy(dtype='datetime64[ns]').astype(np.int64).astype(float)
+    keep = lttb_indices(numeric_x, y.to_numpy(dtype=float), max_points)
+    trace = go.Scattergl if len(keep) > WEBGL_THRESHOLD else go.Scatter
+    return trace(x=x.iloc[keep].to_numpy(), y=y.iloc[keep].to_numpy(), **kwargs)
+
+
+def cached_figure(*depends_on: str):
+    """
+    Memoize a function building a plotly figure: the figure is serialized once per version
+    of the tables it is built from and the JSON is kept in the query cache.
+
+    Args:
+        depends_on: Names of the tables the figure is built from
+    """
+    def decorator(build):
+        @wraps(build)
+        def wrapper(*args, **kwargs):
+            key = cache_key(('figure', build.__qualname__), args, kwargs, depends_on)
+            found, figure_json = QUERY_CACHE.get(key)
+            if not found:
+                figure_json = build(*args, **kwargs).to_json()
+                QUERY_CACHE.put(key, figure_json, depends_on)
+            return pio.from_json(figure_json)
+        return wrapper
+    return decorator
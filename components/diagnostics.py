@@ -0,0 +1,37 @@
+from typing import Dict, Optional
+
+import streamlit as st
+
+from sql.cache import QUERY_CACHE
+from sql.instrumentation import RerunStats
+from sql.manager import DBInstance
+
+
+def diagnostics_panel(rerun: Optional[RerunStats]):
+    """Sidebar panel with the SQL statements of the previous rerun, the connection pool and the query cache."""
+    with st.sidebar.expander('Diagnostica'):
+        if rerun is None or not rerun.queries:
+            st.caption('Nessuna query nel rerun precedente')
+        else:
+            summary = rerun.summary()
+            st.caption(f'Rerun precedente: {rerun.name}')
+            col1, col2, col3 = st.columns(3)
+            col1.metric('Query', int(summary['query'].sum()))
+            col2.metric('Tempo SQL', f"{summary['totale_ms'].sum():.0f} ms")
+            col3.metric('Righe', int(summary['righe'].sum()))
+            st.dataframe(summary, hide_index=True, width='stretch')
+        st.caption('Pool di connessioni')
+        st.json(DBInstance().pool_stats(), expanded=False)
+        st.caption('Cache delle query')
+        st.json(QUERY_CACHE.stats(), expanded=False)
+
+
+def profile_panel(profile: Optional[Dict]):
+    """Sidebar panel with the hot functions of the previous profiled rerun of the page."""
+    with st.sidebar.expander('Profilo'):
+        if profile is None:
+            st.caption('Nessun rerun profilato di questa pagina')
+            return
+        st.caption(f"Rerun precedente: {profile['duration_s']:.2f} s, {profile['samples']} campioni  \n"
+                   f"{profile['path']}")
+        st.dataframe(profile['hot_functions'], hide_index=True, width='stretch')
@@ -0,0 +1,100 @@
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+
+def asof_align(series: Dict[str, pd.Series], fill_value: float = 0.0) -> pd.DataFrame:
+    """
+    Align running balances sampled at different dates on the union of their dates.
+
+    Each value is carried forward until the next observation of the same series: at any
+    date a column holds the last value observed at or before that date, and fill_value
+    before its first observation. With several observations on the same date the last
+    one wins. Series not sorted by date are sorted first, keeping the order of the
+    observations of a same date. The alignment is a single searchsorted per series, with
+    no pivot tables.
+
+    Args:
+        series: Running balances indexed by date, keyed by column name
+        fill_value: Value of a series before its first observation
+
+    Returns:
+        DataFrame indexed by the sorted union of the dates, one column per series
+
+    Example:
+        >>> liquidita = pd.Series([10.0, 15.0], index=pd.to_datetime(['2024-01-01', '2024-01-03']))
+        >>> investimenti = pd.Series([100.0], index=pd.to_datetime(['2024-01-02']))
+        >>> asof_align({'liquidita': liquidita, 'investimenti': investimenti})
+                    liquidita  investimenti
+        2024-01-01       10.0           0.0
+        2024-01-02       10.0         100.0
+        2024-01-03       15.0         100.0
+        >>> unsorted = pd.Series([15.0, 10.0, 12.0], index=pd.to_datetime(['2024-01-03', '2024-01-01', '2024-01-01']))
+        >>> asof_align({'liquidita': unsorted})
+                    liquidita
+        2024-01-01       12.0
+        2024-01-03       15.0
+    """
+    series = {name: values if values.index.is_monotonic_increasing else values.sort_index(kind='stable')
+              for name, values in series.items()}
+    last_of_day = {name: values[~values.index.duplicated(keep='last')] for name, values in series.items()}
+    dates = pd.DatetimeIndex(np.unique(np.concatenate([values.index.values for values in last_of_day.values()])))
+
+    aligned = {}
+    for name, values in last_of_day.items():
+        if values.empty:
+            aligned[name] = np.full(len(dates), fill_value)
+            continue
+        positions = np.searchsorted(values.index.values, dates.values, side='right') - 1
+        column = values.to_numpy(dtype=float)[np.maximum(positions, 0)]
+        aligned[name] = np.where(positions >= 0, column, fill_value)
+    return pd.DataFrame(aligned, index=dates)
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Select the points to keep when downsampling a series with Largest-Triangle-Three-Buckets.
+
+    The first and last points are always kept; the points in between are split in
+    threshold - 2 buckets and from each bucket the point forming the largest triangle
+    with the point kept in the previous bucket and the average of the next bucket is
+    kept, so peaks and drops survive the downsampling.
+
+    Args:
+        x: Numeric x values, sorted
+        y: Numeric y values
+        threshold: Number of points to keep
+
+    Returns:
+        Sorted positions of the points to keep, all of them if there are no more than threshold
+
+    Example:
+        >>> y = np.array([0.0, 1.0, 0.0, 0.0, 9.0, 0.0, 0.0, 1.0, 0.0, 0.0])
+        >>> lttb_indices(np.arange(10.0), y, 4)
+        array([0, 4, 5, 9])
+    """
+    size = len(x)
+    if threshold >= size or threshold < 3:
+        return np.arange(size)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    edges = (np.arange(threshold - 1) * (size - 2) / (threshold - 2)).astype(int) + 1
+    edges[-1] = size - 1
+    # Averages of every bucket, the last point being a bucket of its own
+    bounds = np.append(edges, size)
+    counts = np.diff(bounds)
+    mean_x = np.add.reduceat(x, edges) / counts
+    mean_y = np.add.reduceat(y, edges) / counts
+    selected = np.empty(threshold, dtype=int)
+    selected[0], selected[-1] = 0, size - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_x, next_y = mean_x[bucket + 1], mean_y[bucket + 1]
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
@@ -1,11 +1,33 @@
-import argparse
+import os
 
 import streamlit as st
 
-parser = argparse.ArgumentParser()
-parser.add_argument('--data-path', default='./data', help='path to csv file containing bank incomes and expenses')
+from cli import parse_args
+from sql.instrumentation import serve_metrics
 
-args = parser.parse_args()
+args = parse_args()
+
+
+@st.cache_resource(show_spinner=False)
+def directory_importer(data_path: str, watch: bool, interval: float):
+    """Start the importer of data_path once per server, not once per session."""
+    # Imported here: it loads pandas and the DAOs, which reruns served by the cache do not need
+    from sql.importer import start_importer
+
+    return start_importer(data_path, watch, interval)
+
+
+directory_importer(args.data_path, args.watch, args.watch_interval)
+
+
+@st.cache_resource(show_spinner=False)
+def metrics_server(port: int, host: str):
+    """Serve the SQL metrics once per server."""
+    return serve_metrics(port, host)
+
+
+if os.getenv('METRICS_PORT'):
+    metrics_server(int(os.getenv('METRICS_PORT')), os.getenv('METRICS_HOST', '127.0.0.1'))
 
 
 if __name__ == '__main__':
@@ -1,5 +1,11 @@
+import os
+import sys
+
 import streamlit as st
 
+from sql.instrumentation import diagnostics_enabled
+
+
 def build_menu():
     st.set_page_config(layout="wide")
     st.markdown(
@@ -22,3 +28,22 @@ def build_menu():
     st.sidebar.page_link("pages/imposte.py", label="Imposte")
     st.sidebar.page_link("pages/caricamento.py", label="Caricamento Dati")
 
+    page_file = sys._getframe(1).f_globals.get('__file__', '')
+    # The panels are drawn before the page runs: they show the previous rerun
+    if diagnostics_enabled():
+        from components.diagnostics import diagnostics_panel
+        from sql.instrumentation import RECORDER, export_metrics
+
+        diagnostics_panel(st.session_state.get('diagnostics'))
+        st.session_state['diagnostics'] = RECORDER.start_rerun(os.path.basename(page_file))
+        export_metrics()
+
+    from cli import parse_args
+
+    args = parse_args()
+    if args.profile and page_file:
+        from components.diagnostics import profile_panel
+        from profiling import LAST_PROFILES, profile_rerun
+
+        profile_panel(LAST_PROFILES.get(os.path.splitext(os.path.basename(page_file))[0]))
+        profile_rerun(page_file, args.profile_dir)
@@ -4,8 +4,7 @@ from components.tables_utils import style_dataframe
 from menu import build_menu
 import streamlit as st
 
-from sql.dao_list import TITOLI_DAO, ORDINI_DAO
-from sql.daos.ordini import analyze_orders
+from sql.dao_list import TITOLI_DAO, ORDINI_DAO, POSIZIONI_DAO
 from sql.models.titoli import TitoliModel
 
 build_menu()
@@ -24,7 +23,7 @@ def build_titolo_table(titolo: TitoliModel):
     ordini_list = ORDINI_DAO.get_by_isin(titolo.isin, as_dataframe=False)
     ordini_df = pd.DataFrame([o.to_dict() for o in ordini_list])
 
-    ordini_metrics = analyze_orders(ordini_list, titolo.strumento)
+    ordini_metrics = POSIZIONI_DAO.get_metrics(titolo.isin, titolo.strumento)
 
     ordini_df_styled = style_dataframe(ordini_df)
     st.dataframe(ordini_df_styled,
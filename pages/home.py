@@ -1,21 +1,23 @@
-from datetime import timedelta, datetime
+from datetime import date, timedelta
 
 import pandas as pd
 import plotly.graph_objects as go
 import streamlit as st
 
+from components.charts import cached_figure, line_trace, target_points
+from dataframes.timeseries import asof_align
 from menu import build_menu
-from sql.dao_list import MOVIMENTI_DAO, ORDINI_DAO, TITOLI_DAO
+from sql.dao_list import MOVIMENTI_DAO, ORDINI_DAO, SALDI_DAO, TITOLI_DAO
 
 build_menu()
 
 
 
 def create_basic_info(titoli_df):
-    today = datetime.now()
+    today = date.today()
 
-    m1 = MOVIMENTI_DAO.get_liquidita()
-    m2 = MOVIMENTI_DAO.get_liquidita(today - timedelta(days=30))
+    m1 = SALDI_DAO.get_liquidita()
+    m2 = SALDI_DAO.get_liquidita(today - timedelta(days=30))
 
     o1 = sum(titoli_df.loc[titoli_df['quantita'] > 0]['valore_di_carico'])
 
@@ -35,18 +37,30 @@ def create_basic_info(titoli_df):
 
 
 
-def plot_liquidita_investimenti(ordini_df, movimenti_df):
-    fig = go.Figure()
+def saldi_from_operations(movimenti_df, ordini_df):
+    """Build the balances series client side, until the saldi table has been backfilled."""
+    saldi_df = asof_align({
+        'investimenti': pd.Series(-ordini_df['importo'].cumsum().values, index=ordini_df['data_operazione']),
+        'liquidita': pd.Series(movimenti_df['importo'].cumsum().values, index=movimenti_df['data_operazione']),
+    })
+    saldi_df['totale'] = saldi_df['investimenti'] + saldi_df['liquidita']
+    return saldi_df.rename_axis('data').reset_index()
+
 
-    # Get cumulative sums for each dataset
-    investimenti_cum = -ordini_df['importo'].cumsum()
-    liquidita_cum = movimenti_df['importo'].cumsum()
+@cached_figure(SALDI_DAO.table_name, MOVIMENTI_DAO.table_name, ORDINI_DAO.table_name)
+def liquidita_investimenti_figure(max_points: int):
+    saldi_df = SALDI_DAO.get_series()
+    if saldi_df.empty:
+        saldi_df = saldi_from_operations(MOVIMENTI_DAO.get_in_timerange(as_dataframe=True),
+                                         ORDINI_DAO.get_in_timerange(as_dataframe=True))
+    fig = go.Figure()
 
     # Add investment trace
     fig.add_trace(
-        go.Scatter(
-            x=ordini_df['data_operazione'],
-            y=investimenti_cum,
+        line_trace(
+            saldi_df['data'],
+            saldi_df['investimenti'],
+            max_points,
             mode='lines',
             name='Investimenti',
             line=dict(color='#1f77b4', width=2)
@@ -55,37 +69,22 @@ def plot_liquidita_investimenti(ordini_df, movimenti_df):
 
     # Add liquidity trace
     fig.add_trace(
-        go.Scatter(
-            x=movimenti_df['data_operazione'],
-            y=liquidita_cum,
+        line_trace(
+            saldi_df['data'],
+            saldi_df['liquidita'],
+            max_points,
             mode='lines',
             name='Liquidita',
             line=dict(color='#1f4324', width=2)
         )
     )
 
-    # Create total amount data
-    # Since the two datasets might have different dates, we need to handle this properly
-    # Combine dates from both datasets
-    all_dates = pd.concat([
-        pd.DataFrame({'Date': ordini_df['data_operazione'], 'Type': 'Investimenti', 'Value': investimenti_cum}),
-        pd.DataFrame({'Date': movimenti_df['data_operazione'], 'Type': 'Liquidita', 'Value': liquidita_cum})
-    ])
-
-    # Group by date and pivot to get values for each type
-    pivot_df = all_dates.pivot_table(index='Date', columns='Type', values='Value', aggfunc='last')
-
-    # Forward fill missing values (to carry forward last known value)
-    pivot_df = pivot_df.bfill()
-
-    # Calculate total (sum of both columns)
-    pivot_df['Total'] = pivot_df['Investimenti'] + pivot_df['Liquidita']
-
     # Add total trace
     fig.add_trace(
-        go.Scatter(
-            x=pivot_df.index,
-            y=pivot_df['Total'],
+        line_trace(
+            saldi_df['data'],
+            saldi_df['totale'],
+            max_points,
             mode='lines',
             name='Patrimonio',
             line=dict(color='#ff7f0e', width=3, dash='dot')  # Orange dotted line for total
@@ -107,7 +106,11 @@ def plot_liquidita_investimenti(ordini_df, movimenti_df):
         ),
         margin=dict(t=50, l=50, r=50, b=50)
     )
-    st.plotly_chart(fig)
+    return fig
+
+
+def plot_liquidita_investimenti():
+    st.plotly_chart(liquidita_investimenti_figure(target_points()))
 
 def titoli_attivi_table(titoli_df):
     titoli_df = titoli_df.loc[titoli_df['quantita'] > 0]
@@ -124,10 +127,7 @@ def titoli_attivi_table(titoli_df):
 with st.spinner('Caricamento ...'):
     titoli_df = TITOLI_DAO.get_full_info()
 
-    movimenti_df = MOVIMENTI_DAO.get_in_timerange(as_dataframe=True)
-    ordini_df = ORDINI_DAO.get_in_timerange(as_dataframe=True)
-
     create_basic_info(titoli_df)
     st.subheader('Titoli attivi nel portafoglio')
     titoli_attivi_table(titoli_df)
-    plot_liquidita_investimenti(ordini_df, movimenti_df)
+    plot_liquidita_investimenti()
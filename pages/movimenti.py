@@ -1,20 +1,24 @@
+from datetime import datetime
+
 import plotly.graph_objects as go
 import streamlit as st
 
+from components.charts import cached_figure
 from components.tables_utils import build_operation_table
 from menu import build_menu
-from sql.dao_list import MOVIMENTI_DAO, ORDINI_DAO
-from sql.models.movimenti import MovimentiCategory, MovimentiModel
+from sql.dao_list import MOVIMENTI_DAO
+from sql.models.movimenti import MovimentiCategory
 
 build_menu()
 
 
-def barchart_entrate_uscite_ext():
+@cached_figure(MOVIMENTI_DAO.table_name)
+def entrate_uscite_figure(category: MovimentiCategory, title: str):
+    _, monthly = MOVIMENTI_DAO.get_category_breakdown()
     fig = go.Figure()
-    monthly_sum_in = MOVIMENTI_DAO.aggregate_by_date('month', MovimentiModel.importo,
-                                      (MovimentiModel.is_entrata() & MovimentiModel.is_category(MovimentiCategory.Bonifici)) )
-    monthly_sum_out = MOVIMENTI_DAO.aggregate_by_date('month', MovimentiModel.importo,
-                                      (MovimentiModel.is_uscita() & MovimentiModel.is_category(MovimentiCategory.Bonifici)) )
+    monthly = monthly.loc[monthly['categoria'] == category.value]
+    monthly_sum_in = monthly.loc[monthly['segno'] == 'entrata']
+    monthly_sum_out = monthly.loc[monthly['segno'] == 'uscita']
 
     # Add income bars
     fig.add_trace(go.Bar(
@@ -34,7 +38,7 @@ def barchart_entrate_uscite_ext():
 
     # Update layout
     fig.update_layout(
-        title='Movimenti conti esterni',
+        title=title,
         xaxis_title='Mese',
         yaxis_title='Totale',
         barmode='group',
@@ -48,62 +52,42 @@ def barchart_entrate_uscite_ext():
         ),
         margin=dict(t=50, l=50, r=50, b=50)
     )
-    st.plotly_chart(fig)
-
-def barchart_entrate_uscite_portafoglio():
-    fig = go.Figure()
-    monthly_sum_in = MOVIMENTI_DAO.aggregate_by_date('month', MovimentiModel.importo,
-                                      (MovimentiModel.is_entrata() & MovimentiModel.is_category(MovimentiCategory.CompravenditaTitoli)))
-    monthly_sum_out = MOVIMENTI_DAO.aggregate_by_date('month', MovimentiModel.importo,
-                                      (MovimentiModel.is_uscita() & MovimentiModel.is_category(MovimentiCategory.CompravenditaTitoli)))
+    return fig
 
-    # Add income bars
-    fig.add_trace(go.Bar(
-        x=monthly_sum_in['month'],
-        y=monthly_sum_in['total'],
-        name='Entrate',
-        marker_color='#2ecc71'
-    ))
-
-    # Add expense bars
-    fig.add_trace(go.Bar(
-        x=monthly_sum_out['month'],
-        y=monthly_sum_out['total'],
-        name='Uscite',
-        marker_color='#ff0000'
-    ))
 
-    # Update layout
-    fig.update_layout(
-        title='Movimenti portafoglio',
-        xaxis_title='Mese',
-        yaxis_title='Totale',
-        barmode='group',
-        template='plotly_white',
-        showlegend=True,
-        legend=dict(
-            yanchor="top",
-            y=0.99,
-            xanchor="right",
-            x=0.99
-        ),
-        margin=dict(t=50, l=50, r=50, b=50)
-    )
-    st.plotly_chart(fig)
+def barchart_entrate_uscite(category: MovimentiCategory, title: str):
+    st.plotly_chart(entrate_uscite_figure(category, title))
 
 
-def create_badges():
+def create_badges(totals):
     c1, c2, c3, c4 = st.columns([1, 1, 1, 1])
-    c1.metric(label='Bonifici', value=f'{MOVIMENTI_DAO.sum_by_category(MovimentiCategory.Bonifici)} €')
-    c2.metric(label='CompravenditaTitoli', value=f'{MOVIMENTI_DAO.sum_by_category(MovimentiCategory.CompravenditaTitoli)} €')
-    c3.metric(label='Tasse', value=f'{MOVIMENTI_DAO.sum_by_category(MovimentiCategory.Tasse)} €')
-    c4.metric(label='SpeseConto', value=f'{MOVIMENTI_DAO.sum_by_category(MovimentiCategory.SpeseConto)} €')
+    c1.metric(label='Bonifici', value=f'{totals[MovimentiCategory.Bonifici]} €')
+    c2.metric(label='CompravenditaTitoli', value=f'{totals[MovimentiCategory.CompravenditaTitoli]} €')
+    c3.metric(label='Tasse', value=f'{totals[MovimentiCategory.Tasse]} €')
+    c4.metric(label='SpeseConto', value=f'{totals[MovimentiCategory.SpeseConto]} €')
+
+
+def search_movimenti(page_size: int = 50):
+    c1, c2, c3 = st.columns([3, 2, 1])
+    query = c1.text_input('Cerca nei movimenti', placeholder='Descrizione completa...')
+    periodo = c2.date_input('Periodo', value=(), format='DD/MM/YYYY')
+    pagina = c3.number_input('Pagina', min_value=1, value=1, step=1)
+    if not query:
+        return
+    start_date, end_date = None, None
+    if len(periodo) == 2:
+        start_date = datetime.combine(periodo[0], datetime.min.time())
+        end_date = datetime.combine(periodo[1], datetime.max.time())
+    risultati = MOVIMENTI_DAO.search(query, start_date, end_date, page=pagina - 1, page_size=page_size)
+    if risultati.empty:
+        st.write(f'Nessun movimento trovato per "{query}"')
+    else:
+        build_operation_table(risultati)
 
 
 with st.spinner('Caricamento ...'):
-    movimenti_df = MOVIMENTI_DAO.get_in_timerange(as_dataframe=True)
-    ordini_df = ORDINI_DAO.get_in_timerange(as_dataframe=True)
-    create_badges()
+    totals, _ = MOVIMENTI_DAO.get_category_breakdown()
+    create_badges(totals)
     col1, col2 = st.columns([2, 1])
 
     with col1:
@@ -114,7 +98,9 @@ with st.spinner('Caricamento ...'):
         )
 
         build_operation_table(MOVIMENTI_DAO.get_by_category(category=MovimentiCategory(option)))
+
+        search_movimenti()
     with col2:
-        barchart_entrate_uscite_ext()
-        barchart_entrate_uscite_portafoglio()
+        barchart_entrate_uscite(MovimentiCategory.Bonifici, 'Movimenti conti esterni')
+        barchart_entrate_uscite(MovimentiCategory.CompravenditaTitoli, 'Movimenti portafoglio')
 
@@ -0,0 +1,117 @@
+"""
+Sampling profiler of the page reruns, enabled with --profile.
+
+A background thread samples the stack of the thread running the page script every few
+milliseconds, from the page script frame down, until the script returns. Each rerun writes
+in the profile directory:
+    <page>-<time>.folded: the sampled stacks in the folded format of flamegraph.pl and
+        speedscope, e.g. flamegraph.pl profiles/home-20250101-120000-000000.folded > home.svg
+    <page>-<time>.json: duration, number of samples and hot functions of the rerun
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+
+from sql.utils import logger
+
+SAMPLE_INTERVAL = 0.005
+
+# Last profile of each page, shown at its next rerun
+LAST_PROFILES: Dict[str, Dict] = {}
+
+
+def frame_label(code) -> str:
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+def hot_functions(samples: Counter, limit: int = 15) -> pd.DataFrame:
+    """
+    Rank the functions of the sampled stacks.
+
+    Args:
+        samples: Number of samples of each stack, root first
+        limit: Number of functions returned
+
+    Returns:
+        DataFrame with funzione, totale_% (samples with the function on the stack) and
+        proprio_% (samples with the function running), by totale_% descending
+    """
+    total = sum(samples.values())
+    inclusive, own = Counter(), Counter()
+    for stack, count in samples.items():
+        own[stack[-1]] += count
+        for label in set(stack):
+            inclusive[label] += count
+    df = pd.DataFrame({'funzione': list(inclusive),
+                       'totale_%': [inclusive[label] / total * 100 for label in inclusive],
+                       'proprio_%': [own[label] / total * 100 for label in inclusive]})
+    return df.sort_values(['totale_%', 'proprio_%'], ascending=False).head(limit).round(1)
+
+
+class RerunProfiler:
+    """Sample the stacks of a page rerun running in the current thread."""
+
+    def __init__(self, page_file: str, output_dir: str, interval: float = SAMPLE_INTERVAL):
+        self.page_file = page_file
+        self.page = os.path.splitext(os.path.basename(page_file))[0]
+        self.output_dir = output_dir
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.samples: Counter = Counter()
+        self.started = time.perf_counter()
+
+    def start(self):
+        threading.Thread(target=self._run, name=f'profiler-{self.page}', daemon=True).start()
+
+    def _page_stack(self) -> Optional[Tuple[str, ...]]:
+        """The stack of the rerun from the module frame of the page, None once the script returned."""
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        page_depth = None
+        while frame is not None:
+            stack.append(frame_label(frame.f_code))
+            if frame.f_code.co_filename == self.page_file:
+                # Functions of the page are on the stack too: the module frame is the outermost
+                page_depth = len(stack)
+            frame = frame.f_back
+        return None if page_depth is None else tuple(reversed(stack[:page_depth]))
+
+    def _run(self):
+        while (stack := self._page_stack()) is not None:
+            self.samples[stack] += 1
+            time.sleep(self.interval)
+        try:
+            self._write()
+        except Exception as e:
+            logger.warning(f'Could not write the profile of {self.page}: {e}')
+
+    def _write(self):
+        duration = time.perf_counter() - self.started
+        if not self.samples:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"{self.page}-{datetime.now():%Y%m%d-%H%M%S-%f}")
+        with open(f'{path}.folded', 'w') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{';'.join(stack)} {count}\n")
+        hot = hot_functions(self.samples)
+        with open(f'{path}.json', 'w') as f:
+            json.dump(dict(page=self.page, duration_s=round(duration, 3), samples=sum(self.samples.values()),
+                           hot_functions=hot.to_dict(orient='records')), f, indent=2)
+        LAST_PROFILES[self.page] = dict(duration_s=duration, samples=sum(self.samples.values()),
+                                        hot_functions=hot, path=f'{path}.folded')
+        logger.info(f'Profiled {self.page} rerun in {duration:.2f}s, written to {path}.folded')
+
+
+def profile_rerun(page_file: str, output_dir: str) -> RerunProfiler:
+    """Profile the rest of the page rerun running in the current thread."""
+    profiler = RerunProfiler(page_file, output_dir)
+    profiler.start()
+    return profiler
@@ -44,4 +44,5 @@ else
         -p ${POSTGRES_PORT}:5432 \
         postgres
 fi
+python -m sql.schema
 streamlit run main.py
\ No newline at end of file
@@ -0,0 +1,163 @@
+import importlib.util
+import os
+import threading
+from typing import Dict, Iterable, Optional
+
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.util import find_tables
+
+from sql.cache import QUERY_CACHE
+from sql.manager import DBInstance
+from sql.utils import logger
+
+
+class AnalyticsEngine:
+    """
+    Columnar copies of the Postgres tables in an embedded DuckDB file, used to run aggregations.
+
+    A table is copied again the first time it is read after its version in the database
+    changed, i.e. after each write by any process, so the copies never serve stale totals.
+    """
+    db = DBInstance()
+
+    def __init__(self, path: str):
+        # Imported here, with the Arrow readers, only when the DuckDB backend is used
+        import duckdb
+
+        self.path = path
+        self._connection = duckdb.connect(path)
+        self._lock = threading.Lock()
+        self._synced: Dict[str, int] = {}
+
+    def sync(self, tables: Iterable):
+        """
+        Copy the given tables from Postgres if they changed since the last copy.
+
+        Args:
+            tables: SQLAlchemy Table objects
+        """
+        tables = list(tables)
+        # Read again now, the local generations cover the writes when the versions cannot be read
+        versions = QUERY_CACHE.versions([table.name for table in tables])
+        for table, version in zip(tables, versions):
+            generation = (version, QUERY_CACHE.generations([table.name])[0])
+            if self._synced.get(table.name) == generation:
+                continue
+            from sql.readers import read_copy
+
+            df = read_copy(select(table), self.db.engine)
+            # Nanosecond timestamps cannot be compared with the year 1 lower bound of in_timerange
+            df = df.astype({column: 'datetime64[us]' for column in df.select_dtypes('datetime').columns})
+            self._connection.register('_snapshot', df)
+            self._connection.execute(f'CREATE OR REPLACE TABLE {table.name} AS SELECT * FROM _snapshot')
+            self._connection.unregister('_snapshot')
+            self._synced[table.name] = generation
+            logger.info(f'Copied {len(df)} rows of {table.name} into {self.path}')
+
+    def query(self, stmt: Select) -> pd.DataFrame:
+        """
+        Run a select on the DuckDB copies of the tables it reads.
+
+        Args:
+            stmt: The select, written for Postgres
+
+        Returns:
+            The result as a DataFrame
+        """
+        from sql.readers import compile_query
+
+        sql = compile_query(stmt)
+        with self._lock:
+            self.sync(find_tables(stmt, check_columns=True))
+            return self._connection.execute(sql).df()
+
+
+def _create_engine() -> Optional[AnalyticsEngine]:
+    if os.getenv('ANALYTICS_BACKEND', 'postgres').lower() != 'duckdb':
+        return None
+    if importlib.util.find_spec('duckdb') is None:
+        logger.warning('ANALYTICS_BACKEND is duckdb but duckdb is not installed, aggregating in Postgres')
+        return None
+    import duckdb
+
+    path = os.getenv('ANALYTICS_DB_PATH', 'analytics.duckdb')
+    try:
+        return AnalyticsEngine(path)
+    except duckdb.IOException as e:
+        # Another process holds the lock of the file
+        logger.warning(f'Cannot open {path}, aggregating in Postgres: {e}')
+        return None
+
+
+_engine: Optional[AnalyticsEngine] = None
+_engine_created = False
+_engine_lock = threading.Lock()
+
+
+def get_analytics() -> Optional[AnalyticsEngine]:
+    """
+    The engine running the aggregations, opened on the first call rather than at import so
+    processes that never aggregate do not lock the DuckDB file.
+
+    Returns:
+        None unless ANALYTICS_BACKEND=duckdb, duckdb is installed and the file could be opened
+    """
+    global _engine, _engine_created
+    with _engine_lock:
+        if not _engine_created:
+            _engine, _engine_created = _create_engine(), True
+    return _engine
+
+
+def _frames_match(expected: pd.DataFrame, actual: pd.DataFrame) -> bool:
+    expected, actual = (df.astype({column: 'datetime64[ns]' for column in df.select_dtypes('datetime').columns})
+                        for df in (expected, actual))
+    expected = expected.sort_values(list(expected.columns)).reset_index(drop=True)
+    actual = actual.sort_values(list(actual.columns)).reset_index(drop=True)
+    try:
+        pd.testing.assert_frame_equal(expected, actual, check_dtype=False)
+    except AssertionError as e:
+        logger.warning(e)
+        return False
+    return True
+
+
+if __name__ == '__main__':
+    # Parity check of the aggregations routed to DuckDB against Postgres
+    from sql.dao_list import MOVIMENTI_DAO, ORDINI_DAO
+    from sql.models.movimenti import MovimentiModel, MovimentiCategory
+    from sql.models.ordini import OrdiniModel
+
+    if importlib.util.find_spec('duckdb') is None:
+        raise SystemExit('duckdb is not installed')
+    # The DAOs below run the expected results in Postgres, the actual ones in this engine
+    os.environ['ANALYTICS_BACKEND'] = 'postgres'
+    engine = AnalyticsEngine(':memory:')
+    checks = {
+        'movimenti by month': lambda: MOVIMENTI_DAO.aggregate_by_date.__wrapped__(
+            MOVIMENTI_DAO, 'month', MovimentiModel.importo),
+        'ordini by year': lambda: ORDINI_DAO.aggregate_by_date.__wrapped__(
+            ORDINI_DAO, 'year', OrdiniModel.importo, OrdiniModel.importo > 0),
+        'category breakdown': lambda: MOVIMENTI_DAO.get_category_breakdown.__wrapped__(MOVIMENTI_DAO),
+        'liquidita': lambda: MOVIMENTI_DAO.get_liquidita.__wrapped__(MOVIMENTI_DAO),
+        'sum by category': lambda: MOVIMENTI_DAO.sum_by_category.__wrapped__(
+            MOVIMENTI_DAO, MovimentiCategory.Bonifici),
+    }
+    mismatches = 0
+    for name, check in checks.items():
+        MOVIMENTI_DAO.analytics = ORDINI_DAO.analytics = None
+        expected = check()
+        MOVIMENTI_DAO.analytics = ORDINI_DAO.analytics = engine
+        actual = check()
+        if isinstance(expected, tuple):
+            same = expected[0] == actual[0] and _frames_match(expected[1], actual[1])
+        elif isinstance(expected, pd.DataFrame):
+            same = _frames_match(expected, actual)
+        else:
+            same = round(expected - actual, 2) == 0
+        mismatches += not same
+        print(f'{name}: {"ok" if same else "MISMATCH"}')
+    if mismatches:
+        raise SystemExit(1)
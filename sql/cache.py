@@ -0,0 +1,235 @@
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from functools import wraps
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
+
+import pandas as pd
+from sqlalchemy import inspect, text
+from sqlalchemy.sql import ClauseElement
+
+from sql.models.basic import Base
+from sql.utils import logger
+
+# Versions bumped by the triggers of sql.schema at every write, by any process
+VERSIONS_QUERY = text('SELECT tabella, versione FROM versioni_tabelle')
+
+
+class QueryCache:
+    """
+    LRU cache for DAO query results.
+
+    Every table has a generation counter that is bumped after each successful insert:
+    cache keys include the generations of the tables a query reads, so results computed
+    before an upload are never served again and simply age out of the cache.
+
+    Writes of other processes, e.g. python -m sql.importer, are noticed through the versions
+    the database keeps per table: they are read at most every check_interval seconds and the
+    tables whose version changed are bumped.
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 256 * 1024 * 1024, check_interval: float = 1.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.check_interval = check_interval
+        self._entries: OrderedDict = OrderedDict()
+        self._generations: Dict[str, int] = defaultdict(int)
+        self._versions: Optional[Dict[str, int]] = None
+        self._checked: Optional[float] = None
+        self._versions_failed = False
+        self._lock = threading.RLock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def generations(self, tables: Iterable[str]) -> Tuple[int, ...]:
+        self.check_versions()
+        with self._lock:
+            return tuple(self._generations[table] for table in tables)
+
+    def versions(self, tables: Iterable[str]) -> Tuple[Optional[int], ...]:
+        """
+        The versions of the given tables in the database, read again now.
+
+        Returns:
+            The versions, None for the tables never written since the triggers were created
+            and for all of them when the versions cannot be read
+        """
+        self.check_versions(force=True)
+        with self._lock:
+            return tuple((self._versions or {}).get(table) for table in tables)
+
+    def check_versions(self, force: bool = False):
+        """Bump the tables written by other processes, unless checked less than check_interval ago."""
+        now = time.monotonic()
+        with self._lock:
+            if not force and self._checked is not None and now - self._checked < self.check_interval:
+                return
+            self._checked = now
+        versions = self._read_versions()
+        if versions is None:
+            return
+        with self._lock:
+            known, self._versions = self._versions, versions
+        if known is not None:
+            changed = [table for table in set(known) | set(versions) if known.get(table) != versions.get(table)]
+            if changed:
+                self._invalidate(changed)
+
+    def bump(self, *tables: str):
+        """Invalidate every cached result depending on the given tables, after writing them."""
+        self._invalidate(tables)
+        # The versions of the tables just written changed too: take them without bumping again
+        versions = self._read_versions()
+        if versions is not None:
+            with self._lock:
+                if self._versions is not None:
+                    self._versions.update({table: versions[table] for table in tables if table in versions})
+
+    def _invalidate(self, tables: Iterable[str]):
+        tables = set(tables)
+        with self._lock:
+            for table in tables:
+                self._generations[table] += 1
+            stale = [key for key, (_, entry_tables, _) in self._entries.items()
+                     if set(entry_tables) & tables]
+            for key in stale:
+                self._remove(key)
+
+    def _read_versions(self) -> Optional[Dict[str, int]]:
+        from sql.manager import DBInstance
+
+        try:
+            with DBInstance().engine.connect() as connection:
+                versions = dict(connection.execute(VERSIONS_QUERY).all())
+        except Exception as e:
+            if not self._versions_failed:
+                logger.warning(f'Cannot read the table versions, writes of other processes are not noticed '
+                               f'until python -m sql.schema runs: {e}')
+            self._versions_failed = True
+            return None
+        self._versions_failed = False
+        return versions
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key][0]
+            self.misses += 1
+            return False, None
+
+    def put(self, key: Hashable, value: Any, tables: Tuple[str, ...]):
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, tables, size)
+            self.size += size
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            requests = self.hits + self.misses
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                hit_rate=round(self.hits / requests, 4) if requests else 0.0,
+                evictions=self.evictions,
+                entries=len(self._entries),
+                size_bytes=self.size,
+            )
+
+    def _remove(self, key: Hashable):
+        _, _, size = self._entries.pop(key)
+        self.size -= size
+
+
+def _estimate_size(value: Any) -> int:
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(sys.getsizeof(item) for item in value)
+    return sys.getsizeof(value)
+
+
+def _freeze(value: Any) -> Hashable:
+    """Turn a query argument into a hashable cache key component."""
+    if isinstance(value, ClauseElement):
+        return str(value.compile(compile_kwargs={'literal_binds': True}))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if hasattr(value, '__clause_element__'):
+        return _freeze(value.__clause_element__())
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return repr(value)
+
+
+def _copy(value: Any) -> Any:
+    """Return a copy of mutable results so callers cannot alter the cached value."""
+    if isinstance(value, pd.DataFrame):
+        return value.copy()
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    if isinstance(value, tuple):
+        return tuple(_copy(item) for item in value)
+    if isinstance(value, dict):
+        return {key: _copy(item) for key, item in value.items()}
+    if isinstance(value, Base):
+        # A new detached instance with the same column values, relationships are not loaded
+        return type(value)(**{attribute.key: getattr(value, attribute.key)
+                              for attribute in inspect(value).mapper.column_attrs})
+    return value
+
+
+def cache_key(name: Hashable, args: tuple, kwargs: dict, tables: Tuple[str, ...]) -> Hashable:
+    """
+    Build the cache key of a call from its name, its arguments and the current generation
+    of the tables it reads.
+    """
+    return name, _freeze(args), _freeze(kwargs), QUERY_CACHE.generations(tables)
+
+
+def cached_query(*depends_on: str):
+    """
+    Memoize a DAO method on its arguments and on the generation of the DAO table
+    and of the other tables it reads.
+
+    Args:
+        depends_on: Names of the tables read by the query besides the DAO table
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            tables = (self.table_name, *depends_on)
+            key = cache_key((type(self).__name__, method.__name__), args, kwargs, tables)
+            found, value = QUERY_CACHE.get(key)
+            if not found:
+                value = method(self, *args, **kwargs)
+                QUERY_CACHE.put(key, value, tables)
+            return _copy(value)
+        return wrapper
+    return decorator
+
+
+QUERY_CACHE = QueryCache(max_entries=int(os.getenv('QUERY_CACHE_MAX_ENTRIES', 256)),
+                         max_bytes=int(os.getenv('QUERY_CACHE_MAX_MB', 256)) * 1024 * 1024,
+                         check_interval=float(os.getenv('QUERY_CACHE_CHECK_SECONDS', 1)))
@@ -1,7 +1,37 @@
-from sql.daos.movimenti import Movimenti
-from sql.daos.ordini import Ordini
-from sql.daos.titoli import Titoli
+"""
+The DAOs shared by the pages, constructed on first use: importing a page only loads the
+modules of the DAOs it reads. The tables are created by sql.schema, not here.
+"""
+import importlib
+import threading
 
-MOVIMENTI_DAO = Movimenti()
-TITOLI_DAO = Titoli()
-ORDINI_DAO = Ordini()
\ No newline at end of file
+# Module and class of each DAO
+DAOS = {
+    'TITOLI_DAO': ('sql.daos.titoli', 'Titoli'),
+    'ORDINI_DAO': ('sql.daos.ordini', 'Ordini'),
+    'MOVIMENTI_DAO': ('sql.daos.movimenti', 'Movimenti'),
+    'POSIZIONI_DAO': ('sql.daos.posizioni', 'Posizioni'),
+    'SALDI_DAO': ('sql.daos.saldi', 'Saldi'),
+}
+# DAOs notified when the rows of a DAO change
+LISTENERS = {
+    'ORDINI_DAO': ('POSIZIONI_DAO', 'SALDI_DAO'),
+    'MOVIMENTI_DAO': ('SALDI_DAO',),
+}
+
+__all__ = list(DAOS)
+
+_lock = threading.RLock()
+
+
+def __getattr__(name: str):
+    if name not in DAOS:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    with _lock:
+        if name not in globals():
+            module, class_name = DAOS[name]
+            dao = getattr(importlib.import_module(module), class_name)()
+            for listener in LISTENERS.get(name, ()):
+                dao.add_listener(__getattr__(listener))
+            globals()[name] = dao
+    return globals()[name]
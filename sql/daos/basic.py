@@ -1,18 +1,27 @@
+import io
 from abc import ABC
 from datetime import datetime
-from typing import Optional, List, Any, Dict, Tuple, Union
+from typing import Optional, List, Any, Dict, Iterable, Tuple, Union
 
 import pandas as pd
 import psycopg2
-from sqlalchemy import select, func, and_, asc, text
+from sqlalchemy import (select, delete, func, and_, asc, text, exists, inspect, MetaData, Table, Column, BigInteger,
+                        Computed)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateColumn
+from sql.analytics import AnalyticsEngine, get_analytics
+from sql.cache import cached_query, QUERY_CACHE
 from sql.manager import DBInstance
 from sql.models.basic import Base, OperationBase
-from sql.utils import logger
+from sql.utils import logger, coerce_dataframe, dataframe_to_params
 
 
 class BasicDao(ABC):
     """A base class for handling data operations using SQLAlchemy."""
     db = DBInstance()
+    # Engine of the aggregations, the one of ANALYTICS_BACKEND when None
+    analytics: Optional[AnalyticsEngine] = None
     model_class: type(Base)
 
     def __init__(self, model_class: type(Base)):
@@ -24,45 +33,227 @@ class BasicDao(ABC):
         """
         self.model_class = model_class
         self.table_name = model_class.__tablename__
-        self.create_table()
+        self.listeners: List['BasicDao'] = []
 
     def create_table(self):
-        """Create all tables defined in the models."""
+        """Create all tables defined in the models. Run by sql.schema, not at construction."""
         Base.metadata.create_all(self.db.engine, tables=[self.model_class.__table__])
         logger.info(f'Table {self.table_name} ready in database')
 
+    def prepare_dataframe(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Derive the columns computed at ingest time. The default implementation returns the dataframe as is.
+
+        Args:
+            df: The pandas DataFrame about to be inserted
+
+        Returns:
+            The DataFrame to insert
+        """
+        return df
+
+    def add_listener(self, listener: 'BasicDao'):
+        """
+        Register a DAO whose table is derived from this one: its on_insert is called with the
+        rows inserted here, inside the same transaction.
+        """
+        self.listeners.append(listener)
+
+    def on_insert(self, connection: Connection, source: 'BasicDao', rows: pd.DataFrame):
+        """
+        Update this table after rows have been inserted in the table of a DAO it listens to.
+        The default implementation does nothing.
+
+        Args:
+            connection: Connection of the transaction inserting the rows
+            source: The DAO the rows were inserted with
+            rows: The inserted rows
+        """
+
+    def rebuild(self):
+        """
+        Recompute this table from the whole content of the tables it listens to, e.g. after rows
+        have been deleted from them. The default implementation does nothing.
+        """
+
+    def _notify_listeners(self, connection: Connection, rows: pd.DataFrame):
+        if rows.empty:
+            return
+        for listener in self.listeners:
+            listener.on_insert(connection, self, rows)
+
+    def _returned_columns(self) -> List[Column]:
+        """Columns returned by the inserts: the full rows when a listener needs them."""
+        table = self.model_class.__table__
+        return list(table.columns) if self.listeners else list(table.primary_key.columns)
+
     def insert(self, data: List[Base]):
         """
             Process batch items individually when batch insert fails.
             Returns:
                 Dict with individual processing results
             """
-        results = {
-            'success_count': 0,
-            'failed_items': [],
-            'errors': []
-        }
+        results = self._empty_results()
         with self.db.session as session:
             for idx, item in enumerate(data):
                 try:
                     session.add(item)
+                    if self.listeners:
+                        session.flush()
+                        row = {column.name: getattr(item, column.key) for column in self.model_class.__table__.columns}
+                        self._notify_listeners(session.connection(), pd.DataFrame([row]))
                     session.commit()
                     results['success_count'] += 1
                 except Exception as item_error:
                     session.rollback()
 
-                    results['errors'].append({
-                        'index': idx,
-                        'item': item,
-                        'error': str(item_error)
-                    })
                     if hasattr(item_error, 'orig') and isinstance(item_error.orig, psycopg2.errors.UniqueViolation):
+                        results['skipped_count'] += 1
                         logger.warn(f'Item {item} already exists, skipping.')
                     else:
+                        results['errors'].append({
+                            'index': idx,
+                            'item': item,
+                            'error': str(item_error)
+                        })
                         logger.warn(f'Inserting item {item} raised exception {item_error}')
 
         return results
 
+    def bulk_insert(self, df: pd.DataFrame) -> Dict:
+        """
+        Insert a dataframe in a single transaction: rows are streamed with COPY into a
+        temporary staging table, the rows already in the table are anti-joined away on the
+        dedup key and only the new ones are merged with INSERT ... ON CONFLICT DO NOTHING.
+
+        Args:
+            df: The pandas DataFrame to insert, with columns named as the table columns
+
+        Returns:
+            Dict with the same keys returned by insert
+        """
+        results = self._empty_results()
+        table = self.model_class.__table__
+        df = coerce_dataframe(df, table).reset_index(drop=True)
+        columns = [table.c[name] for name in df.columns]
+        required = [column.name for column in columns if not column.nullable]
+        missing = df[required].isna().any(axis=1)
+        for idx, row in df.loc[missing].iterrows():
+            results['errors'].append({'index': idx, 'item': row.to_dict(), 'error': 'Missing required value'})
+        df = df.loc[~missing]
+        if df.empty:
+            return results
+
+        # Generated columns, as the row hash, are computed in the staging table too
+        generated = [Column(column.name, column.type, Computed(column.computed.sqltext, persisted=True))
+                     for column in table.columns if column.computed is not None]
+        staging = Table(f'{self.table_name}_staging', MetaData(),
+                        Column('row_number', BigInteger),
+                        *[Column(column.name, column.type) for column in columns],
+                        *generated,
+                        prefixes=['TEMPORARY'], postgresql_on_commit='DROP')
+        key = [staging.c[name] for name in self._dedup_key()]
+        buffer = io.StringIO()
+        df.to_csv(buffer, header=False, index=True, na_rep=r'\N')
+        buffer.seek(0)
+
+        # Self references (titoli.isin) are always satisfied by the row itself
+        references = [exists().where(fk.column == staging.c[fk.parent.name])
+                      for fk in table.foreign_keys if fk.column.table is not table]
+        with self.db.engine.begin() as connection:
+            staging.create(connection)
+            cursor = connection.connection.cursor()
+            copied = [column.name for column in staging.columns if column.computed is None]
+            cursor.copy_expert(f"COPY {staging.name} ({', '.join(copied)}) "
+                               f"FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer)
+            # Statistics of the batch let the planner choose between index lookups and a hash join
+            connection.execute(text(f'ANALYZE {staging.name}'))
+
+            # Drop the rows already in the table with one anti-join on the key, so that
+            # re-uploading an overlapping export only inserts, and notifies the listeners of, the new rows
+            present = connection.execute(
+                delete(staging).where(exists().where(and_(*[table.c[k.name] == k for k in key])))).rowcount
+
+            merged = select(*[staging.c[column.name] for column in columns])
+            orphans = []
+            if references:
+                orphans = connection.execute(select(staging).where(~and_(*references))).mappings().all()
+                for orphan in orphans:
+                    item = {name: orphan[name] for name in ['row_number'] + list(df.columns)}
+                    results['errors'].append({'index': item.pop('row_number'),
+                                              'item': item,
+                                              'error': 'Referenced row does not exist'})
+                merged = merged.where(and_(*references))
+            # Rows repeated in the batch are inserted once, the first occurrence wins
+            merged = merged.distinct(*key).order_by(*key, staging.c.row_number)
+
+            stmt = (pg_insert(table)
+                    .from_select([column.name for column in columns], merged)
+                    .on_conflict_do_nothing()
+                    .returning(*self._returned_columns()))
+            result = connection.execute(stmt)
+            inserted = pd.DataFrame(result.all(), columns=list(result.keys()))
+            self._notify_listeners(connection, inserted)
+
+        results['success_count'] = len(inserted)
+        results['skipped_count'] = len(df) - len(inserted) - len(orphans)
+        repeated = results['skipped_count'] - present
+        logger.info(f'Bulk inserted {len(inserted)} rows into {self.table_name}, skipped {present} '
+                    f'already present and {repeated} repeated in the batch')
+        return results
+
+    def _dedup_key(self) -> List[str]:
+        """Columns identifying a row across uploads: the unique columns, or else the primary key."""
+        table = self.model_class.__table__
+        return ([column.name for column in table.columns if column.unique]
+                or [column.name for column in table.primary_key.columns])
+
+    @staticmethod
+    def _empty_results() -> Dict:
+        return {
+            'success_count': 0,
+            'skipped_count': 0,
+            'failed_items': [],
+            'errors': []
+        }
+
+    def core_insert(self, df: pd.DataFrame, batch_size: int = 10000) -> Dict:
+        """
+        Insert a dataframe with Core insert executemany batches, skipping rows already present.
+
+        Args:
+            df: The pandas DataFrame to insert
+            batch_size: Number of rows sent for each executemany
+
+        Returns:
+            Dict with the same keys returned by insert
+        """
+        results = self._empty_results()
+        table = self.model_class.__table__
+        params = self.dataframe_to_params(df)
+        stmt = pg_insert(table).on_conflict_do_nothing().returning(*self._returned_columns())
+        with self.db.engine.begin() as connection:
+            for start in range(0, len(params), batch_size):
+                batch = params[start:start + batch_size]
+                result = connection.execute(stmt, batch)
+                inserted = pd.DataFrame(result.all(), columns=list(result.keys()))
+                self._notify_listeners(connection, inserted)
+                results['success_count'] += len(inserted)
+        results['skipped_count'] = len(params) - results['success_count']
+        return results
+
+    def dataframe_to_params(self, df: pd.DataFrame) -> List[Dict]:
+        """
+        Convert a pandas DataFrame to Core insert parameters, column by column.
+
+        Args:
+            df: The pandas DataFrame to convert
+
+        Returns:
+            List of dictionaries, one per row
+        """
+        return dataframe_to_params(df, self.model_class.__table__)
+
     def dataframe_to_sql(self, df: pd.DataFrame):
         """
         Convert a pandas DataFrame to a list of SQLAlchemy ORM instances.
@@ -73,22 +264,78 @@ class BasicDao(ABC):
         Returns:
             List of ORM instances
         """
-        records = []
-        for _, row in df.iterrows():
-            record_data = row.to_dict()
-            record = self.model_class(**record_data)
-            records.append(record)
-        return records
+        return [self.model_class(**params) for params in self.dataframe_to_params(df)]
+
+    def insert_dataframe(self, df: pd.DataFrame, method: str = 'copy') -> Dict:
+        """
+        Insert a dataframe with the given method.
+
+        Args:
+            df: The pandas DataFrame to insert
+            method: 'copy' for the bulk COPY path, 'core' for Core insert executemany batches,
+                'orm' to add and commit one row at a time, which is slower but pinpoints
+                the rows that cannot be inserted
+
+        Returns:
+            Dict with success_count, skipped_count and errors
+        """
+        # Identity and computed columns are filled in by the database, e.g. when loading a snapshot
+        generated = [column.name for column in self.model_class.__table__.columns
+                     if column.identity is not None or column.computed is not None]
+        df = self.prepare_dataframe(df.drop(columns=generated, errors='ignore'))
+        bulk_methods = {'copy': self.bulk_insert, 'core': self.core_insert}
+        results = None
+        if method in bulk_methods:
+            try:
+                results = bulk_methods[method](df)
+            except Exception as e:
+                logger.warning(f'Bulk insert into {self.table_name} failed, inserting row by row: {e}')
+                method = 'orm'
+        if results is None:
+            if method != 'orm':
+                raise ValueError(f'Unknown insert method {method}')
+            results = self.insert(self.dataframe_to_sql(df))
+        if results['success_count']:
+            QUERY_CACHE.bump(self.table_name, *[listener.table_name for listener in self.listeners])
+        return results
+
+    def insert_dataframes(self, chunks: Iterable[pd.DataFrame], method: str = 'copy') -> Dict:
+        """
+        Insert the chunks of a table one after the other, each in its own transaction.
+
+        Args:
+            chunks: The pandas DataFrames to insert, e.g. from sql.utils.iter_file_chunks
+            method: The insert method, see insert_dataframe
+
+        Returns:
+            Dict with the counts and errors of all the chunks
+        """
+        results = self._empty_results()
+        offset = 0
+        for chunk in chunks:
+            chunk_results = self.insert_dataframe(chunk.reset_index(drop=True), method)
+            results['success_count'] += chunk_results['success_count']
+            results['skipped_count'] += chunk_results['skipped_count']
+            results['failed_items'] += chunk_results['failed_items']
+            results['errors'] += [{**error, 'index': error['index'] + offset} for error in chunk_results['errors']]
+            offset += len(chunk)
+        return results
 
-    def insert_from_dataframe(self, df: pd.DataFrame) -> Tuple[bool, str]:
+    def insert_from_dataframe(self, df: Union[pd.DataFrame, Iterable[pd.DataFrame]],
+                              method: str = 'copy') -> Tuple[bool, str]:
         try:
-            processed = self.dataframe_to_sql(df)
-            results = self.insert(processed)
+            if isinstance(df, pd.DataFrame):
+                results = self.insert_dataframe(df, method)
+            else:
+                results = self.insert_dataframes(df, method)
             if not results:
                 msg = 'Something went wrong uploading file'
                 return False, msg
-            success_count, error_count = results['success_count'], len(results['errors'])
+            success_count, skipped_count, error_count = (results['success_count'], results['skipped_count'],
+                                                         len(results['errors']))
             msg = f'Successfully inserted {success_count} items into {self.table_name}. '
+            if skipped_count:
+                msg += f'Skipped {skipped_count} items already present. '
             if error_count:
                 msg += f'Could not insert {error_count} items'
             return True, msg
@@ -97,14 +344,28 @@ class BasicDao(ABC):
             logger.warning(msg)
         return False,  msg
 
-    def get_all(self, stmt = None, as_dataframe: bool = False) -> Union[List[Base], pd.DataFrame]:
+    def get_all(self, stmt = None, as_dataframe: bool = False,
+                reader: str = 'sql') -> Union[List[Base], pd.DataFrame]:
         """
         Retrieve all records from the table.
 
+        Args:
+            stmt: The select to run, all the table by default
+            as_dataframe: Return a DataFrame instead of model instances
+            reader: How DataFrames are read: 'sql' with pd.read_sql, 'copy' streaming COPY ... TO STDOUT
+                into the Arrow CSV reader, 'arrow' with the ADBC driver decoding straight into Arrow
+
         Returns:
             List of all model instances
         """
         stmt = select(self.model_class) if stmt is None else stmt
+        if as_dataframe and reader != 'sql':
+            from sql.readers import read_copy, read_arrow
+
+            readers = {'copy': read_copy, 'arrow': read_arrow}
+            if reader not in readers:
+                raise ValueError(f'Unknown reader {reader}')
+            return readers[reader](stmt, self.db.engine)
         with self.db.session as session:
             if as_dataframe:
                 df = pd.read_sql(stmt, session.bind)
@@ -115,11 +376,70 @@ class BasicDao(ABC):
         with self.db.session as session:
             return session.execute(stmt).scalar_one_or_none()
 
+    def aggregate(self, stmt) -> pd.DataFrame:
+        """
+        Run an aggregation query, on the DuckDB analytics copies when ANALYTICS_BACKEND=duckdb.
+
+        Args:
+            stmt: The select to run
+
+        Returns:
+            The result as a DataFrame
+        """
+        analytics = self.analytics or get_analytics()
+        if analytics is not None:
+            try:
+                return analytics.query(stmt)
+            except Exception as e:
+                logger.warning(f'Analytics query on {self.table_name} failed, running it in Postgres: {e}')
+        return self.get_all(stmt, as_dataframe=True)
+
+    def aggregate_one(self, stmt) -> Any:
+        """Run an aggregation query returning a single value, see aggregate."""
+        df = self.aggregate(stmt)
+        return None if df.empty else df.iat[0, 0]
+
 
 class BasicTimedDao(BasicDao, ABC):
     """A class for handling time-series data with filtering capabilities."""
     model_class: type(OperationBase)
 
+    def create_table(self):
+        super().create_table()
+        self.migrate_surrogate_key()
+
+    def migrate_surrogate_key(self):
+        """
+        Migrate a table created with the natural key as composite primary key to the bigint id
+        primary key and the unique row_hash. Rows whose natural key differed only in the float
+        representation of the amounts have the same hash: only the first one is kept.
+        """
+        if 'id' in {column['name'] for column in inspect(self.db.engine).get_columns(self.table_name)}:
+            return
+        table = self.model_class.__table__
+        with self.db.engine.begin() as connection:
+            primary_key = inspect(connection).get_pk_constraint(self.table_name)['name']
+            connection.execute(text(f'ALTER TABLE {self.table_name} DROP CONSTRAINT {primary_key}'))
+            for column in (table.c.id, table.c.row_hash):
+                definition = CreateColumn(column).compile(dialect=connection.dialect)
+                connection.execute(text(f'ALTER TABLE {self.table_name} ADD COLUMN {definition}'))
+            duplicates = connection.execute(text(
+                f'DELETE FROM {self.table_name} a USING {self.table_name} b '
+                f'WHERE a.row_hash = b.row_hash AND a.id > b.id')).rowcount
+            connection.execute(text(f'ALTER TABLE {self.table_name} ADD PRIMARY KEY (id)'))
+            connection.execute(text(f'ALTER TABLE {self.table_name} '
+                                    f'ADD CONSTRAINT {self.table_name}_row_hash_key UNIQUE (row_hash)'))
+        logger.info(f'Migrated {self.table_name} to the id primary key and the row_hash unique key')
+        QUERY_CACHE.bump(self.table_name)
+        if duplicates:
+            logger.warning(f'Removed {duplicates} duplicated rows from {self.table_name}')
+            # The derived tables still count the removed rows. Those not created yet are backfilled
+            # from the deduplicated rows by their own create_table
+            for listener in self.listeners:
+                if inspect(self.db.engine).has_table(listener.table_name):
+                    listener.rebuild()
+
+    @cached_query()
     def get_in_timerange(self,
                          start_date: Optional[datetime] = None,
                          end_date: Optional[datetime] = None,
@@ -134,6 +454,7 @@ class BasicTimedDao(BasicDao, ABC):
         )
         return self.get_all(stmt, as_dataframe=as_dataframe)
 
+    @cached_query()
     def aggregate_by_date(self, interval: str, column, where = None) -> pd.DataFrame:
         stmt = (select(
             func.date_trunc(interval, self.model_class.data_operazione).label(interval),
@@ -146,4 +467,4 @@ class BasicTimedDao(BasicDao, ABC):
         ).order_by(
             func.date_trunc(interval, self.model_class.data_operazione)
         ))
-        return self.get_all(stmt, as_dataframe=True)
\ No newline at end of file
+        return self.aggregate(stmt)
\ No newline at end of file
@@ -1,19 +1,101 @@
 from datetime import datetime
-from typing import Optional
+from typing import Optional, Dict, Tuple
 
 import pandas as pd
-from sqlalchemy import select, func, and_
+from sqlalchemy import (select, func, and_, or_, tuple_, update, delete, insert, text, desc, Float,
+                        String, inspect, literal)
 
+from sql.cache import cached_query, QUERY_CACHE
 from sql.daos.basic import BasicTimedDao
-from sql.models.movimenti import MovimentiModel, MovimentiCategory
+from sql.models.movimenti import (MovimentiModel, MovimentiCategory, RegoleCategorieModel, category_map,
+                                  classify_descrizioni)
+from sql.utils import logger
 
 
 class Movimenti(BasicTimedDao):
     """Class for handling banking movements data."""
 
     def __init__(self):
+        self._trigram_search: Optional[bool] = None
         super().__init__(MovimentiModel)
 
+    @property
+    def trigram_search(self) -> bool:
+        """Whether the trigram index of the full descriptions exists, looked up once."""
+        if self._trigram_search is None:
+            indexes = inspect(self.db.engine).get_indexes(self.table_name)
+            self._trigram_search = any(index['name'] == 'ix_movimenti_descrizione_trgm' for index in indexes)
+        return self._trigram_search
+
+    def create_table(self):
+        """Create the movimenti and category rules tables, adding the category column to older schemas."""
+        super().create_table()
+        RegoleCategorieModel.__table__.create(self.db.engine, checkfirst=True)
+        with self.db.engine.begin() as connection:
+            connection.execute(text('ALTER TABLE movimenti ADD COLUMN IF NOT EXISTS categoria VARCHAR'))
+            connection.execute(text('CREATE INDEX IF NOT EXISTS ix_movimenti_categoria_data '
+                                    'ON movimenti (categoria, data_operazione)'))
+        self.create_search_index()
+        self.reclassify()
+
+    def create_search_index(self):
+        """Index the full descriptions with pg_trgm, when the extension is available."""
+        if self.db.engine.dialect.name != 'postgresql':
+            return
+        try:
+            with self.db.engine.begin() as connection:
+                connection.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+                connection.execute(text('CREATE INDEX IF NOT EXISTS ix_movimenti_descrizione_trgm '
+                                        'ON movimenti USING gist (descrizione_completa gist_trgm_ops)'))
+            self._trigram_search = True
+        except Exception as e:
+            logger.warning(f'Trigram index not available, searching movimenti with LIKE: {e}')
+
+    def prepare_dataframe(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Assign the category of each movement with the category_map rules."""
+        df = df.copy()
+        df['categoria'] = classify_descrizioni(df['descrizione'])
+        return df
+
+    def reclassify(self) -> int:
+        """
+        Align the stored categories with category_map. Only movements without a category,
+        in a category whose rules changed since the last run, or matching the keywords of
+        such a category are classified again.
+
+        Returns:
+            Number of movements whose category changed
+        """
+        rules = {(category.value, keyword, priorita)
+                 for priorita, (category, keywords) in enumerate(category_map.items())
+                 for keyword in keywords}
+        classified = MovimentiModel.classify()
+        with self.db.engine.begin() as connection:
+            applied = {tuple(rule) for rule in connection.execute(
+                select(RegoleCategorieModel.categoria, RegoleCategorieModel.keyword, RegoleCategorieModel.priorita))}
+            changed = {categoria for categoria, _, _ in rules ^ applied}
+
+            affected = [MovimentiModel.categoria.is_(None)]
+            if changed:
+                affected.append(MovimentiModel.categoria.in_(changed))
+                affected += [MovimentiModel.matches_rules(category) for category in category_map
+                             if category.value in changed]
+            stmt = (update(MovimentiModel)
+                    .where(or_(*affected), MovimentiModel.categoria.is_distinct_from(classified))
+                    .values(categoria=classified))
+            updated = connection.execute(stmt).rowcount
+
+            if changed:
+                connection.execute(delete(RegoleCategorieModel))
+                connection.execute(insert(RegoleCategorieModel),
+                                   [dict(categoria=categoria, keyword=keyword, priorita=priorita)
+                                    for categoria, keyword, priorita in rules])
+        if updated:
+            QUERY_CACHE.bump(self.table_name)
+        logger.info(f'Reclassified {updated} movements, rules changed for {sorted(changed)}')
+        return updated
+
+    @cached_query()
     def get_liquidita(self, start_date: Optional[datetime] = None,
                          end_date: Optional[datetime] = None) -> float:
         """Calculate total liquidity (sum of entrate_uscite)."""
@@ -22,9 +104,10 @@ class Movimenti(BasicTimedDao):
             .where(MovimentiModel.in_timerange(start_date, end_date))
         )
         # Calculate total from the filtered results
-        total = self.get_one(stmt)
+        total = self.aggregate_one(stmt)
         return round(total, 2) if total else 0.0
 
+    @cached_query()
     def sum_by_category(self, category: MovimentiCategory, start_date: Optional[datetime] = None,
                         end_date: Optional[datetime] = None) -> float:
         """Calculate total investments positive value."""
@@ -34,9 +117,39 @@ class Movimenti(BasicTimedDao):
                         MovimentiModel.is_category(category)))
         )
         # Calculate total from the filtered results
-        total = self.get_one(stmt)
+        total = self.aggregate_one(stmt)
         return round(total, 2) if total else 0.0
 
+    @cached_query()
+    def get_category_breakdown(self, start_date: Optional[datetime] = None,
+                               end_date: Optional[datetime] = None
+                               ) -> Tuple[Dict[MovimentiCategory, float], pd.DataFrame]:
+        """
+        Classify movements into categories and sum them with a single GROUP BY GROUPING SETS query.
+
+        Returns:
+            Totals per category and a DataFrame with columns month, categoria, segno, total
+        """
+        month = func.date_trunc('month', MovimentiModel.data_operazione)
+        categoria = MovimentiModel.categoria
+        segno = MovimentiModel.sign()
+        stmt = (
+            select(month.label('month'), categoria.label('categoria'), segno.label('segno'),
+                   func.sum(MovimentiModel.importo).label('total'))
+            .where(MovimentiModel.in_timerange(start_date, end_date))
+            .group_by(func.grouping_sets(tuple_(month, categoria, segno), tuple_(categoria)))
+        )
+        df = self.aggregate(stmt)
+        by_category = df['month'].isna()
+        totals = {category: 0.0 for category in MovimentiCategory}
+        for categoria, total in df.loc[by_category, ['categoria', 'total']].itertuples(index=False):
+            totals[MovimentiCategory(categoria)] = round(total, 2)
+        monthly = (df.loc[~by_category & df['segno'].notna()]
+                   .sort_values('month')
+                   .reset_index(drop=True))
+        return totals, monthly
+
+    @cached_query()
     def get_by_category(self, category: MovimentiCategory, start_date: Optional[datetime] = None,
                         end_date: Optional[datetime] = None) -> pd.DataFrame:
         """Filter movements by category."""
@@ -48,6 +161,43 @@ class Movimenti(BasicTimedDao):
         )
         return self.get_all(stmt, as_dataframe=True)
 
+    def search(self, query: str, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+               page: int = 0, page_size: int = 50) -> pd.DataFrame:
+        """
+        Search movements whose full description contains the query, most relevant first.
+        With pg_trgm the ranking is the word similarity of the query to the closest part of the
+        description, served by the GiST index in nearest neighbour order; otherwise shorter
+        descriptions rank first. Not cached: every query typed would take an entry.
+
+        Args:
+            query: Text to look for, case insensitive
+            start_date: Oldest operation date to consider
+            end_date: Newest operation date to consider
+            page: Zero based page number
+            page_size: Number of movements per page
+
+        Returns:
+            DataFrame with the movimenti columns and a rank column
+        """
+        descrizione = MovimentiModel.descrizione_completa
+        escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        if self.trigram_search:
+            distance = literal(query, String).op('<<->', return_type=Float)(descrizione)
+            rank, order = 1 - distance, [distance, desc(MovimentiModel.data_operazione)]
+        else:
+            rank = 1.0 / (1 + func.length(descrizione))
+            order = [desc(rank), desc(MovimentiModel.data_operazione)]
+        stmt = (
+            select(MovimentiModel, rank.label('rank'))
+            .where(and_(MovimentiModel.in_timerange(start_date, end_date),
+                        descrizione.ilike(f'%{escaped}%', escape='\\')))
+            .order_by(*order)
+            .limit(page_size)
+            .offset(page * page_size)
+        )
+        return self.get_all(stmt, as_dataframe=True)
+
+    @cached_query()
     def get_by_description(self, description: str, start_date: Optional[datetime] = None,
                         end_date: Optional[datetime] = None) -> pd.DataFrame:
         """Get account stamp duty taxes."""
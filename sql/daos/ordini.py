@@ -1,8 +1,9 @@
 from typing import List, Dict
 
 import pandas as pd
-from sqlalchemy import select, asc
+from sqlalchemy import select, asc, and_, func, ColumnElement
 
+from sql.cache import cached_query
 from sql.daos.basic import BasicTimedDao
 from sql.models.ordini import OrdiniModel
 
@@ -13,6 +14,7 @@ class Ordini(BasicTimedDao):
     def __init__(self):
         super().__init__(OrdiniModel)
 
+    @cached_query()
     def get_by_isin(self, isin: str, as_dataframe: bool = True) -> pd.DataFrame:
         """Filter orders by ISIN."""
         stmt = (
@@ -22,26 +24,64 @@ class Ordini(BasicTimedDao):
         )
         return self.get_all(stmt, as_dataframe)
 
-def analyze_orders(ordini: List[OrdiniModel], strumento: str) -> Dict:
+def _is_acquisto():
+    return and_(OrdiniModel.prezzo != 0, OrdiniModel.importo < 0)
+
+
+def _is_vendita():
+    return and_(OrdiniModel.prezzo != 0, OrdiniModel.importo > 0)
+
+
+def order_totals_columns() -> List[ColumnElement]:
+    """
+    Aggregate columns computing, in SQL, the same totals as order_totals.
+    Meant to be selected grouping the orders by isin.
+    """
+    def total(expression, where=None):
+        aggregate = func.sum(expression) if where is None else func.sum(expression).filter(where)
+        return func.coalesce(aggregate, 0)
+
+    return [
+        total(OrdiniModel.quantita, _is_acquisto()).label('quantita_comprata'),
+        total(OrdiniModel.prezzo * OrdiniModel.quantita, _is_acquisto()).label('costo_acquisti'),
+        total(OrdiniModel.quantita, _is_vendita()).label('quantita_venduta'),
+        total(OrdiniModel.prezzo * OrdiniModel.quantita, _is_vendita()).label('ricavo_vendite'),
+        total(OrdiniModel.importo, _is_vendita()).label('incassi_vendite'),
+        total(OrdiniModel.importo, OrdiniModel.prezzo == 0).label('incassi_dividendi'),
+        total(OrdiniModel.commissione).label('commissioni'),
+    ]
+
+
+def order_totals(ordini: List[OrdiniModel]) -> Dict:
     # acquisto
     ordini_acquisto = [ordine for ordine in ordini if ordine.prezzo != 0 and ordine.importo < 0]
-    quantita_comprata = sum([ordine.quantita for ordine in ordini_acquisto])
-    prezzo_medio_acquisto = (sum([ordine.prezzo * ordine.quantita for ordine in ordini_acquisto]) /
-                    quantita_comprata) if quantita_comprata != 0 else 0
-    if strumento == 'Obbligazione':  # per le obbligazioni consideriamo il prezzo di carico come 100
-        prezzo_medio_acquisto /= 100
     # vendita
     ordini_vendita = [ordine for ordine in ordini if ordine.prezzo != 0 and ordine.importo > 0]
-    quantita_venduta = sum([ordine.quantita for ordine in ordini_vendita])
-    prezzo_medio_vendita = (sum([ordine.prezzo * ordine.quantita for ordine in ordini_vendita]) /
-                             quantita_venduta) if quantita_venduta != 0 else 0
+    return dict(
+        quantita_comprata=sum([ordine.quantita for ordine in ordini_acquisto]),
+        costo_acquisti=sum([ordine.prezzo * ordine.quantita for ordine in ordini_acquisto]),
+        quantita_venduta=sum([ordine.quantita for ordine in ordini_vendita]),
+        ricavo_vendite=sum([ordine.prezzo * ordine.quantita for ordine in ordini_vendita]),
+        incassi_vendite=sum([ordine.importo for ordine in ordini_vendita]),
+        incassi_dividendi=sum([ordine.importo for ordine in ordini if ordine.prezzo == 0]),
+        commissioni=sum([ordine.commissione for ordine in ordini]),
+    )
+
+
+def metrics_from_totals(totals: Dict, strumento: str) -> Dict:
+    quantita_comprata = totals['quantita_comprata']
+    prezzo_medio_acquisto = totals['costo_acquisti'] / quantita_comprata if quantita_comprata != 0 else 0
+    if strumento == 'Obbligazione':  # per le obbligazioni consideriamo il prezzo di carico come 100
+        prezzo_medio_acquisto /= 100
+    quantita_venduta = totals['quantita_venduta']
+    prezzo_medio_vendita = totals['ricavo_vendite'] / quantita_venduta if quantita_venduta != 0 else 0
     if strumento == 'Obbligazione':  # per le obbligazioni consideriamo il prezzo di carico come 100
         prezzo_medio_vendita /= 100
 
-    commissioni = sum([ordine.commissione for ordine in ordini])
-    incassi_netti = (sum([ordine.importo for ordine in ordini if ordine.prezzo == 0])  # incassi da dividendi
-               + sum([ordine.importo for ordine in ordini_vendita])                    # incassi da vendite
-               - quantita_venduta*prezzo_medio_acquisto
+    commissioni = totals['commissioni']
+    incassi_netti = (totals['incassi_dividendi']                   # incassi da dividendi
+                     + totals['incassi_vendite']                   # incassi da vendite
+                     - quantita_venduta*prezzo_medio_acquisto
                      - commissioni)                                        # costi di acquisto delle vendite
     rendimento = incassi_netti / (quantita_venduta * prezzo_medio_acquisto) if (quantita_venduta > 0 and prezzo_medio_acquisto > 0) else 0 # income / partimonio investito
     return dict(
@@ -56,5 +96,9 @@ def analyze_orders(ordini: List[OrdiniModel], strumento: str) -> Dict:
         rendimento=round(rendimento, 2)
     )
 
+
+def analyze_orders(ordini: List[OrdiniModel], strumento: str) -> Dict:
+    return metrics_from_totals(order_totals(ordini), strumento)
+
 if __name__ == "__main__":
     Ordini()
\ No newline at end of file
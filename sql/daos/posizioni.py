@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, func, delete, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Connection
+
+from sql.cache import cached_query, QUERY_CACHE
+from sql.daos.basic import BasicDao
+from sql.daos.ordini import order_totals_columns, metrics_from_totals
+from sql.models.ordini import OrdiniModel
+from sql.models.posizioni import PosizioniModel
+from sql.utils import logger
+
+
+class Posizioni(BasicDao):
+    """Class for handling the positions table, kept up to date while orders are inserted."""
+
+    def __init__(self):
+        super().__init__(PosizioniModel)
+
+    def create_table(self):
+        """Create the positions table, rebuilding it from the orders history when it is empty."""
+        super().create_table()
+        if (self.get_one(select(PosizioniModel.isin).limit(1)) is None
+                and self.get_one(select(OrdiniModel.id).limit(1)) is not None):
+            self.rebuild()
+
+    def on_insert(self, connection: Connection, source: BasicDao, rows: pd.DataFrame):
+        """Add the totals of the inserted orders to the positions of their isin."""
+        prezzo = rows['prezzo']
+        acquisto = prezzo.notna() & (prezzo != 0) & (rows['importo'] < 0)
+        vendita = prezzo.notna() & (prezzo != 0) & (rows['importo'] > 0)
+        valore = prezzo * rows['quantita']
+        # Same totals as order_totals_columns, for the new orders only
+        deltas = pd.DataFrame({
+            'isin': rows['isin'],
+            'quantita_comprata': rows['quantita'].where(acquisto, 0),
+            'costo_acquisti': valore.where(acquisto, 0),
+            'quantita_venduta': rows['quantita'].where(vendita, 0),
+            'ricavo_vendite': valore.where(vendita, 0),
+            'incassi_vendite': rows['importo'].where(vendita, 0),
+            'incassi_dividendi': rows['importo'].where(prezzo == 0, 0),
+            'commissioni': rows['commissione'],
+            'numero_ordini': np.ones(len(rows), dtype=int),
+        }).groupby('isin', as_index=False).sum()
+
+        stmt = pg_insert(PosizioniModel)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[PosizioniModel.isin],
+            set_={column: PosizioniModel.__table__.c[column] + stmt.excluded[column]
+                  for column in (*PosizioniModel.TOTALS, 'numero_ordini')})
+        connection.execute(stmt, self.dataframe_to_params(deltas))
+
+    def rebuild(self) -> int:
+        """
+        Recompute every position from the full orders history.
+
+        Returns:
+            Number of positions
+        """
+        totals = select(OrdiniModel.isin, *order_totals_columns(), func.count().label('numero_ordini'))
+        totals = totals.group_by(OrdiniModel.isin)
+        with self.db.engine.begin() as connection:
+            connection.execute(delete(PosizioniModel))
+            connection.execute(insert(PosizioniModel).from_select(
+                ['isin', *PosizioniModel.TOTALS, 'numero_ordini'], totals))
+            count = connection.execute(select(func.count()).select_from(PosizioniModel)).scalar_one()
+        QUERY_CACHE.bump(self.table_name)
+        logger.info(f'Rebuilt {count} positions from the orders history')
+        return count
+
+    @cached_query()
+    def get_metrics(self, isin: str, strumento: str) -> dict:
+        """Get the order metrics of an isin, as computed by analyze_orders."""
+        posizione = self.get_one(select(PosizioniModel).where(PosizioniModel.isin == isin))
+        totals = {column: getattr(posizione, column) if posizione else 0 for column in PosizioniModel.TOTALS}
+        return metrics_from_totals(totals, strumento)
+
+
+if __name__ == '__main__':
+    # Backfill the positions from the orders already in the database
+    Posizioni().rebuild()
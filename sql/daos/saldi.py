@@ -0,0 +1,126 @@
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+import pandas as pd
+from sqlalchemy import select, func, delete, desc, text
+from sqlalchemy.engine import Connection
+
+from sql.cache import cached_query, QUERY_CACHE
+from sql.daos.basic import BasicDao
+from sql.models.movimenti import MovimentiModel
+from sql.models.ordini import OrdiniModel
+from sql.models.saldi import SaldiModel
+from sql.utils import logger
+
+# Running balances from :start on, continuing from the last balance before :start
+REFRESH_SALDI = text("""
+    INSERT INTO saldi_giornalieri (data, liquidita, investimenti, totale)
+    SELECT CAST(giorni.data AS date),
+           base.liquidita + SUM(COALESCE(m.importo, 0)) OVER w,
+           base.investimenti - SUM(COALESCE(o.importo, 0)) OVER w,
+           base.liquidita + base.investimenti + SUM(COALESCE(m.importo, 0) - COALESCE(o.importo, 0)) OVER w
+    FROM generate_series(CAST(:start AS date), CAST(:end AS date), interval '1 day') AS giorni(data)
+    CROSS JOIN (
+        SELECT COALESCE((SELECT liquidita FROM saldi_giornalieri WHERE data < :start
+                         ORDER BY data DESC LIMIT 1), 0) AS liquidita,
+               COALESCE((SELECT investimenti FROM saldi_giornalieri WHERE data < :start
+                         ORDER BY data DESC LIMIT 1), 0) AS investimenti
+    ) AS base
+    LEFT JOIN (
+        SELECT CAST(data_operazione AS date) AS data, SUM(importo) AS importo
+        FROM movimenti WHERE data_operazione >= :start GROUP BY 1
+    ) AS m ON m.data = CAST(giorni.data AS date)
+    LEFT JOIN (
+        SELECT CAST(data_operazione AS date) AS data, SUM(importo) AS importo
+        FROM ordini WHERE data_operazione >= :start GROUP BY 1
+    ) AS o ON o.data = CAST(giorni.data AS date)
+    WINDOW w AS (ORDER BY giorni.data)
+""")
+
+
+class Saldi(BasicDao):
+    """Class for handling the daily liquidity and investments balances."""
+
+    def __init__(self):
+        super().__init__(SaldiModel)
+
+    def create_table(self):
+        """Create the balances table, computing every balance when it is empty."""
+        super().create_table()
+        if (self.get_one(select(SaldiModel.data).limit(1)) is None
+                and (self.get_one(select(MovimentiModel.id).limit(1)) is not None
+                     or self.get_one(select(OrdiniModel.id).limit(1)) is not None)):
+            self.rebuild()
+
+    def on_insert(self, connection: Connection, source: BasicDao, rows: pd.DataFrame):
+        """Recompute the balances from the oldest day of the inserted movements or orders."""
+        self.refresh(connection, rows['data_operazione'].min().date())
+
+    def refresh(self, connection: Connection, start: Optional[date] = None):
+        """
+        Recompute the balances from start to the last movement or order. The refresh also
+        covers the days after the last stored balance, and every day if none is stored.
+
+        Args:
+            connection: Connection of the transaction to refresh the balances in
+            start: First day to recompute, defaults to the day after the last stored balance
+        """
+        first_day, last_day = connection.execute(select(
+            func.least(select(func.min(MovimentiModel.data_operazione)).scalar_subquery(),
+                       select(func.min(OrdiniModel.data_operazione)).scalar_subquery()),
+            func.greatest(select(func.max(MovimentiModel.data_operazione)).scalar_subquery(),
+                          select(func.max(OrdiniModel.data_operazione)).scalar_subquery()))).one()
+        if first_day is None:
+            return
+        last_saldo = connection.execute(select(func.max(SaldiModel.data))).scalar_one()
+        first_missing = last_saldo + timedelta(days=1) if last_saldo else first_day.date()
+        start = min(start, first_missing) if start else first_missing
+        start = max(start, first_day.date())
+
+        connection.execute(delete(SaldiModel).where(SaldiModel.data >= start))
+        connection.execute(REFRESH_SALDI, dict(start=start, end=last_day.date()))
+        logger.info(f'Refreshed daily balances from {start} to {last_day.date()}')
+
+    def rebuild(self):
+        """Recompute every daily balance."""
+        with self.db.engine.begin() as connection:
+            connection.execute(delete(SaldiModel))
+            self.refresh(connection)
+        QUERY_CACHE.bump(self.table_name)
+
+    @cached_query()
+    def get_series(self, start_date: Optional[datetime] = None,
+                   end_date: Optional[datetime] = None) -> pd.DataFrame:
+        """Get the daily balances between start_date and end_date."""
+        stmt = select(SaldiModel).order_by(SaldiModel.data)
+        if start_date is not None:
+            stmt = stmt.where(SaldiModel.data >= start_date)
+        if end_date is not None:
+            stmt = stmt.where(SaldiModel.data <= end_date)
+        return self.get_all(stmt, as_dataframe=True)
+
+    @cached_query()
+    def get_saldo(self, at: date) -> Optional[SaldiModel]:
+        """Get the balance at the end of the given day. Cached on the day, so pass a date."""
+        stmt = (select(SaldiModel)
+                .where(SaldiModel.data <= at)
+                .order_by(desc(SaldiModel.data))
+                .limit(1))
+        return self.get_one(stmt)
+
+    def get_liquidita(self, start_date: Optional[date] = None) -> float:
+        """Calculate the liquidity change from start_date to today, or the current liquidity."""
+        saldo = self.get_saldo(date.today())
+        liquidita = saldo.liquidita if saldo else 0.0
+        if start_date is not None:
+            # The balances are cached per day: a datetime would miss the cache at every rerun
+            if isinstance(start_date, datetime):
+                start_date = start_date.date()
+            precedente = self.get_saldo(start_date - timedelta(days=1))
+            liquidita -= precedente.liquidita if precedente else 0.0
+        return round(liquidita, 2)
+
+
+if __name__ == '__main__':
+    # Backfill the daily balances from the movements and orders in the database
+    Saldi().rebuild()
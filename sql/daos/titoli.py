@@ -4,9 +4,11 @@ import pandas as pd
 from sqlalchemy import select, func, case, or_, outerjoin, and_, desc
 from sqlalchemy.orm import selectinload
 
+from sql.cache import cached_query
 from sql.daos.basic import BasicDao
-from sql.daos.ordini import analyze_orders
+from sql.daos.ordini import analyze_orders, metrics_from_totals
 from sql.models.ordini import OrdiniModel
+from sql.models.posizioni import PosizioniModel
 from sql.models.titoli import TitoliModel
 from sql.utils import logger
 
@@ -16,6 +18,7 @@ class Titoli(BasicDao):
     def __init__(self):
         super().__init__(TitoliModel)
 
+    @cached_query('ordini')
     def get_by_isin(self, isin: str) -> Optional[TitoliModel]:
         """Filter by ISIN."""
         try:
@@ -27,6 +30,7 @@ class Titoli(BasicDao):
             logger.error(f'Failed to load titolo with isin {isin} due to exception: {e}')
         return None
 
+    @cached_query('ordini')
     def get_with_quantity(self):
         stmt = (select(TitoliModel.isin, TitoliModel.titolo, TitoliModel.strumento,
                        func.coalesce(func.sum(
@@ -38,17 +42,22 @@ class Titoli(BasicDao):
                 )
         return self.get_all(stmt, True)
 
+    @cached_query('posizioni')
     def get_full_info(self) -> pd.DataFrame:
-        stmt = (select(TitoliModel)
-                .options(selectinload(TitoliModel.ordini))
+        """Get every titolo with the metrics of its orders, read from the positions table."""
+        totals = [func.coalesce(PosizioniModel.__table__.c[column], 0).label(column) for column in PosizioniModel.TOTALS]
+        stmt = (select(TitoliModel.isin, TitoliModel.titolo, TitoliModel.strumento, *totals)
+                .outerjoin(PosizioniModel, TitoliModel.isin == PosizioniModel.isin)
                 .order_by(TitoliModel.strumento, TitoliModel.titolo))
-        titoli_full = self.get_all(stmt, False)
-        titoli_info = [dict(isin=titolo.isin,
-                            titolo=titolo.titolo,
-                            strumento=titolo.strumento,
-                            **analyze_orders(titolo.ordini, titolo.strumento)) for titolo in titoli_full]
+        with self.db.session as session:
+            rows = session.execute(stmt).mappings().all()
+        titoli_info = [dict(isin=row['isin'],
+                            titolo=row['titolo'],
+                            strumento=row['strumento'],
+                            **metrics_from_totals(row, row['strumento'])) for row in rows]
         return pd.DataFrame(titoli_info)
 
+    @cached_query()
     def get_azioni(self, as_dataframe: bool = False) -> Union[List[TitoliModel], pd.DataFrame]:
 
         stmt = (select(TitoliModel)
@@ -56,15 +65,27 @@ class Titoli(BasicDao):
 
         return self.get_all(stmt, as_dataframe)
 
+    @cached_query()
     def get_obbligazioni(self, as_dataframe: bool = False) -> Union[List[TitoliModel], pd.DataFrame]:
 
         stmt = (select(TitoliModel)
                 .where(TitoliModel.strumento == 'Obbligazione'))
 
         return self.get_all(stmt, as_dataframe)
-#
-# if __name__ == '__main__':
-#     result = Titoli().get_full_info()
-#     print(result)
 
 
+if __name__ == '__main__':
+    # Check that the positions table matches analyze_orders over the ORM objects
+    titoli_dao = Titoli()
+    full_info = titoli_dao.get_full_info().set_index('isin')
+    titoli_orm = titoli_dao.get_all(select(TitoliModel).options(selectinload(TitoliModel.ordini)))
+    mismatches = 0
+    for titolo in titoli_orm:
+        expected = analyze_orders(titolo.ordini, titolo.strumento)
+        actual = full_info.loc[titolo.isin, list(expected)].to_dict()
+        if actual != expected:
+            mismatches += 1
+            print(f'{titolo.isin}: expected {expected}, got {actual}')
+    print(f'Checked {len(titoli_orm)} titoli, {mismatches} mismatches')
+    if mismatches:
+        raise SystemExit(1)
@@ -0,0 +1,165 @@
+"""
+Import the Fineco exports found in a directory, skipping the files already imported.
+
+A manifest in the directory records size, modification time and content hash of every
+imported file: unchanged files cost a stat, touched files a hash, and only new or changed
+contents are parsed and loaded.
+
+Run from the repository root:
+    python -m sql.importer --data-path ./data [--watch --interval 60]
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sql.ingest import ingest_files, route_file
+from sql.schema import create_schema
+from sql.utils import logger
+
+MANIFEST_NAME = '.ingest_manifest.json'
+
+
+def file_fingerprint(path: str, block_size: int = 1024 * 1024) -> str:
+    """Hash the content of a file reading it in blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while block := f.read(block_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DirectoryImporter:
+    """Scan a directory of exports and ingest the new or changed files."""
+
+    def __init__(self, data_path: str):
+        self.data_path = data_path
+        self.manifest_path = os.path.join(data_path, MANIFEST_NAME)
+        self.manifest: Dict[str, Dict] = self._load_manifest()
+        self._lock = threading.Lock()
+
+    def _load_manifest(self) -> Dict[str, Dict]:
+        if not os.path.exists(self.manifest_path):
+            return {}
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f'Could not read {self.manifest_path}, importing every file again: {e}')
+            return {}
+
+    def _save_manifest(self):
+        # Write and rename, so that an interrupted save does not lose the manifest
+        temporary = f'{self.manifest_path}.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+        os.replace(temporary, self.manifest_path)
+
+    def pending_files(self) -> Dict[str, Dict]:
+        """
+        Find the exports not imported yet.
+
+        Returns:
+            Manifest entries of the new or changed files, keyed by path relative to the directory
+        """
+        known_hashes = {entry['sha256'] for entry in self.manifest.values()}
+        pending = {}
+        for root, _, files in os.walk(self.data_path):
+            for filename in files:
+                path = os.path.join(root, filename)
+                relative = os.path.relpath(path, self.data_path)
+                if route_file(filename) is None and not filename.lower().endswith('.zip'):
+                    continue
+                stat = os.stat(path)
+                entry = self.manifest.get(relative)
+                if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+                    continue
+                sha256 = file_fingerprint(path)
+                if sha256 in known_hashes:
+                    # Same content already imported, possibly under another name: only refresh the stat
+                    self.manifest[relative] = {**(entry or {}), 'size': stat.st_size,
+                                               'mtime_ns': stat.st_mtime_ns, 'sha256': sha256}
+                    continue
+                pending[relative] = dict(size=stat.st_size, mtime_ns=stat.st_mtime_ns, sha256=sha256)
+        return pending
+
+    def scan(self) -> List[Dict]:
+        """
+        Import the new or changed files of the directory and record them in the manifest.
+        Files that cannot be parsed are recorded too, and retried only when they change.
+
+        Returns:
+            The ingest_files summaries of the imported files
+        """
+        with self._lock:
+            pending = self.pending_files()
+            summaries = []
+            if pending:
+                files = []
+                for relative in sorted(pending):
+                    with open(os.path.join(self.data_path, relative), 'rb') as f:
+                        files.append((relative, f.read()))
+                summaries = ingest_files(files)
+                imported_at = datetime.now().isoformat(timespec='seconds')
+                for relative, entry in pending.items():
+                    outcomes = [summary['esito'] for summary in summaries
+                                if summary['file'] == relative or summary['file'].startswith(f'{relative}/')]
+                    self.manifest[relative] = {**entry, 'imported_at': imported_at,
+                                               'esito': 'ok' if all(o == 'ok' for o in outcomes) else '; '.join(outcomes)}
+                logger.info(f'Imported {len(pending)} files from {self.data_path}')
+            self._save_manifest()
+            return summaries
+
+    def watch(self, interval: float = 60, stop: Optional[threading.Event] = None):
+        """
+        Scan the directory every interval seconds until stop is set.
+
+        Args:
+            interval: Seconds between two scans
+            stop: Event ending the loop, never set by default
+        """
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            try:
+                self.scan()
+            except Exception as e:
+                logger.warning(f'Scanning {self.data_path} failed: {e}')
+            stop.wait(interval)
+
+
+def start_importer(data_path: str, watch: bool = False, interval: float = 60) -> Optional[DirectoryImporter]:
+    """
+    Import the exports of data_path in a background thread, once or every interval seconds.
+
+    Returns:
+        The importer, None if data_path is not a directory
+    """
+    if not os.path.isdir(data_path):
+        logger.info(f'Data path {data_path} not found, nothing to import')
+        return None
+    importer = DirectoryImporter(data_path)
+    target = (lambda: importer.watch(interval)) if watch else importer.scan
+    threading.Thread(target=target, name='directory-importer', daemon=True).start()
+    return importer
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data-path', default='./data')
+    parser.add_argument('--watch', action='store_true', help='keep scanning the directory')
+    parser.add_argument('--interval', type=float, default=60, help='seconds between two scans with --watch')
+    args = parser.parse_args()
+
+    create_schema()
+    importer = DirectoryImporter(args.data_path)
+    if args.watch:
+        importer.watch(args.interval)
+    else:
+        start = time.perf_counter()
+        for summary in importer.scan():
+            logger.info(summary)
+        logger.info(f'Scan took {time.perf_counter() - start:.2f}s')
@@ -0,0 +1,302 @@
+"""
+Parse Fineco exports and load them in the database: routing by file name, adapters from
+the export columns to the table columns, and batch ingestion of many files or ZIP archives.
+"""
+import io
+import multiprocessing
+import os
+import sys
+import threading
+import types
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from sql.utils import convert_file_to_table, iter_file_chunks, logger
+
+
+def adapt_movimenti_df(df: pd.DataFrame) -> pd.DataFrame:
+    rename_dict = {"Data_Operazione": "data_operazione",
+                   "Data_Valuta": "data_valuta",
+                   "Descrizione": "descrizione",
+                   "Descrizione_Completa": "descrizione_completa"}
+    df = df.rename(columns=rename_dict)
+    df['importo'] = df['Entrate'].fillna(0) + df['Uscite'].fillna(0)
+    df = df.drop(columns=['Entrate', 'Uscite', 'Stato'])
+    df['data_operazione'] = pd.to_datetime(df['data_operazione'], dayfirst=True)
+    df['data_valuta'] = pd.to_datetime(df['data_valuta'], dayfirst=True)
+    return df
+
+
+def adapt_ordini_df(df: pd.DataFrame) -> pd.DataFrame:
+    rename_dict = {"Operazione": "data_operazione",
+                   "Data valuta": "data_valuta",
+                   "Isin": "isin",
+                   "Descrizione": "descrizione",
+                   "Segno": "segno",
+                   "Quantita": "quantita",
+                   "Divisa": "divisa",
+                   "Prezzo": "prezzo",
+                   "Cambio": "cambio",
+                   "Controvalore": "controvalore",
+                   }
+    df = df.rename(columns=rename_dict)
+    df['data_operazione'] = pd.to_datetime(df['data_operazione'], dayfirst=True)
+    df['data_valuta'] = pd.to_datetime(df['data_valuta'], dayfirst=True)
+    df['importo'] = df['controvalore'] * df['segno'].map({'A': -1, 'V': 1}).fillna(1).astype(int)
+
+    commissioni = [
+        "Commissioni Fondi Sw/Ingr/Uscita",
+        "Commissioni Fondi Banca Corrispondente",
+        "Spese Fondi Sgr",
+        "Commissioni amministrato"
+    ]
+    conditions = [ df[comm] > 0 for comm in commissioni ]
+
+    df['commissione'] = df[commissioni].fillna(0).sum(axis=1)
+    df['tipo_commissione'] = np.select(conditions, commissioni, default="Nessuna")
+
+    df = df.drop(columns=['Titolo','Commissioni Fondi Sw/Ingr/Uscita', 'Commissioni Fondi Banca Corrispondente',
+                          'Spese Fondi Sgr', 'Commissioni amministrato'])
+    return df
+
+
+def adapt_titoli_df(df: pd.DataFrame) -> pd.DataFrame:
+    rename_dict = {"ISIN": "isin",
+                   "Titolo": "titolo",
+                   "Simbolo": "simbolo",
+                   "Mercato": "mercato",
+                   "Strumento": "strumento",
+                   "Valuta": "valuta"
+                   }
+    df = df.rename(columns=rename_dict)
+    for col in set(df.columns) - set(rename_dict.values()):
+        del df[col]
+    return df
+
+
+# Tables in dependency order, ordini reference titoli, with the prefixes of their export files
+INGEST_ROUTES = (
+    ('titoli', ('portafoglio', 'titoli'), adapt_titoli_df),
+    ('ordini', ('Lista Titoli', 'ordini'), adapt_ordini_df),
+    ('movimenti', ('movements', 'movimenti'), adapt_movimenti_df),
+)
+ADAPTERS = {table: adapter for table, _, adapter in INGEST_ROUTES}
+# Exports at least this large are streamed in chunks by the current process, instead of being
+# parsed whole in a worker and sent back, so that their memory use stays bounded
+STREAMING_MIN_BYTES = 16 * 1024 ** 2
+
+
+def route_file(filename: str) -> Optional[str]:
+    """
+    Find the table of an export from its file name.
+
+    Args:
+        filename: Name of the file, directories are ignored
+
+    Returns:
+        The table name, None if the file name has none of the known prefixes
+    """
+    name = os.path.basename(filename)
+    for table, prefixes, _ in INGEST_ROUTES:
+        if name.startswith(prefixes):
+            return table
+    return None
+
+
+def expand_uploads(files: Iterable[Tuple[str, bytes]]) -> List[Tuple[str, bytes]]:
+    """
+    Replace the .zip archives among the files with the files they contain.
+
+    Args:
+        files: File names and contents
+
+    Returns:
+        File names and contents, the files extracted from an archive are named archive/file
+    """
+    expanded = []
+    for name, content in files:
+        # xlsx files are ZIP archives too, only .zip files are expanded
+        if not name.lower().endswith('.zip'):
+            expanded.append((name, content))
+            continue
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            for member in archive.infolist():
+                member_name = os.path.basename(member.filename)
+                if member.is_dir() or member_name.startswith('.') or member.filename.startswith('__MACOSX'):
+                    continue
+                expanded.append((f'{name}/{member.filename}', archive.read(member)))
+    return expanded
+
+
+def parse_file(table: str, content: bytes) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
+    """
+    Read an export and adapt it to the columns of its table. Runs in the worker processes
+    of ingest_files, so it does not touch the database.
+
+    Args:
+        table: Table of the export, as returned by route_file
+        content: Content of the file
+
+    Returns:
+        The adapted DataFrame and None, or None and the error
+    """
+    try:
+        df = convert_file_to_table(io.BytesIO(content))
+        if df is None:
+            return None, 'Could not convert file to table'
+        return ADAPTERS[table](df), None
+    except Exception as e:
+        return None, f'Could not convert file to table: {e}'
+
+
+_main_lock = threading.Lock()
+
+
+@contextmanager
+def _without_main():
+    """
+    Hide the __main__ module while spawned processes start. Streamlit installs the running
+    page as __main__ and spawn runs it again in every worker, main.py starting the importer.
+    """
+    with _main_lock:
+        main = sys.modules['__main__']
+        placeholder = types.ModuleType('__main__')
+        sys.modules['__main__'] = placeholder
+        try:
+            yield
+        finally:
+            # Unless a rerun of another session installed its page in the meantime
+            if sys.modules['__main__'] is placeholder:
+                sys.modules['__main__'] = main
+
+
+def parse_files(files: List[Tuple[str, str, bytes]], max_workers: Optional[int] = None) -> Dict[str, Tuple]:
+    """
+    Parse exports in spawned worker processes with parse_file.
+
+    Args:
+        files: File names, tables and contents
+        max_workers: Number of parsing processes, defaults to the number of CPUs
+
+    Returns:
+        The parse_file result of each file name, empty if the workers failed
+    """
+    # Spawned workers: forking the multithreaded Streamlit server can deadlock
+    context = multiprocessing.get_context('spawn')
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+            # The workers start on submit
+            with _without_main():
+                futures = {name: executor.submit(parse_file, table, content) for name, table, content in files}
+            return {name: future.result() for name, future in futures.items()}
+    except BrokenProcessPool as e:
+        logger.warning(f'Parsing processes failed, streaming the files in the current process: {e}')
+        return {}
+
+
+def parse_chunks(table: str, content: bytes, summary: Dict) -> Iterator[pd.DataFrame]:
+    """
+    Read an export chunk by chunk and adapt each chunk to the columns of its table.
+
+    Args:
+        table: Table of the export, as returned by route_file
+        content: Content of the file
+        summary: Summary of the file, its righe are counted and a parsing error ends the
+            iteration and is recorded as its esito
+
+    Returns:
+        Iterator over the adapted chunks
+    """
+    try:
+        for chunk in iter_file_chunks(io.BytesIO(content)):
+            chunk = ADAPTERS[table](chunk)
+            summary['righe'] += len(chunk)
+            yield chunk
+    except Exception as e:
+        summary['esito'] = f'Could not convert file to table: {e}'
+
+
+def ingest_files(files: Iterable[Tuple[str, bytes]], max_workers: Optional[int] = None) -> List[Dict]:
+    """
+    Parse many exports in parallel in a process pool and insert them table by table, in
+    dependency order: titoli, then ordini, then movimenti. Exports of STREAMING_MIN_BYTES or
+    more, a single export and the exports the pool failed to parse are streamed instead:
+    parsed and inserted chunk by chunk in the current process.
+
+    Args:
+        files: File names and contents, ZIP archives are expanded
+        max_workers: Number of parsing processes, defaults to the number of CPUs
+
+    Returns:
+        One summary per file with file, tabella, righe, inseriti, saltati, errori and esito
+    """
+    from sql.dao_list import MOVIMENTI_DAO, ORDINI_DAO, TITOLI_DAO
+
+    daos = {dao.table_name: dao for dao in (TITOLI_DAO, ORDINI_DAO, MOVIMENTI_DAO)}
+    summaries = {}
+    routed = []
+    for name, content in expand_uploads(files):
+        table = route_file(name)
+        summaries[name] = dict(file=name, tabella=table, righe=0, inseriti=0, saltati=0, errori=0, esito='')
+        if table is None:
+            summaries[name]['esito'] = f'Could not understand file origin of {name}'
+        else:
+            routed.append((name, table, content))
+
+    parsed = {}
+    pooled = [(name, table, content) for name, table, content in routed if len(content) < STREAMING_MIN_BYTES]
+    if len(pooled) > 1:
+        parsed = parse_files(pooled, max_workers)
+
+    for table, _, _ in INGEST_ROUTES:
+        for name, _, content in sorted(file for file in routed if file[1] == table):
+            summary = summaries[name]
+            try:
+                if name in parsed:
+                    df, error = parsed.pop(name)
+                    if error:
+                        summary['esito'] = error
+                        continue
+                    summary['righe'] = len(df)
+                    results = daos[table].insert_dataframe(df)
+                else:
+                    results = daos[table].insert_dataframes(parse_chunks(table, content, summary))
+            except Exception as e:
+                summary['esito'] = f'Something went wrong inserting dataframe in {table}: {e}'
+                logger.warning(summary['esito'])
+                continue
+            summary.update(inseriti=results['success_count'], saltati=results['skipped_count'],
+                           errori=len(results['errors']), esito=summary['esito'] or 'ok')
+    return list(summaries.values())
+
+
+if __name__ == '__main__':
+    # Check that the parsing workers do not run the page installed as __main__ by Streamlit
+    import tempfile
+
+    # The workers import parse_file from sql.ingest, not from this __main__
+    from sql.ingest import parse_files
+
+    with tempfile.TemporaryDirectory() as directory:
+        marker = os.path.join(directory, 'executed')
+        page = os.path.join(directory, 'main.py')
+        with open(page, 'w') as f:
+            f.write(f'open({marker!r}, "w").close()\n')
+        streamlit_main = types.ModuleType('__main__')
+        streamlit_main.__file__ = page
+        script_main, sys.modules['__main__'] = sys.modules['__main__'], streamlit_main
+        try:
+            exports = [(f'{name}.csv', 'movimenti', b'Data_Operazione;Importo\n01/01/2024;1\n') for name in 'ab']
+            parse_files(exports, max_workers=2)
+        finally:
+            sys.modules['__main__'] = script_main
+        if os.path.exists(marker):
+            print('the parsing workers ran the page: MISMATCH')
+            raise SystemExit(1)
+        print('the parsing workers did not run the page: ok')
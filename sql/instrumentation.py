@@ -0,0 +1,202 @@
+"""
+Timing of the SQL statements run on the engine, enabled with SQL_DIAGNOSTICS=true.
+
+Engine events time every statement and attribute it to the DAO method that issued it. The
+statements are collected per Streamlit rerun, for the diagnostics panel of the sidebar, and
+summed in process wide totals exported in the Prometheus text format:
+    METRICS_FILE: File rewritten with the metrics at each rerun
+    METRICS_PORT: Port of an HTTP endpoint serving the metrics on /metrics
+    METRICS_HOST: Address the endpoint binds to, defaults to 127.0.0.1. The metrics name the
+        DAO methods and their timings: set it to 0.0.0.0 only on a trusted network
+
+The pages import this module to check SQL_DIAGNOSTICS: pandas, SQLAlchemy and the HTTP server
+are imported only once diagnostics are used.
+"""
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+    import pandas as pd
+    from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+# Cumulative metrics of the pool and of the query cache, the others are gauges
+COUNTERS = ('checkouts', 'overflow_events', 'timeouts', 'hits', 'misses', 'evictions')
+
+
+def diagnostics_enabled() -> bool:
+    return os.getenv('SQL_DIAGNOSTICS', 'false').lower() in ('1', 'true', 'yes')
+
+
+def calling_method(max_depth: int = 50) -> str:
+    """
+    Name the DAO method that issued the statement being executed: the outermost method of
+    a class of sql.daos on the stack, so get_liquidita rather than the get_all it calls.
+    Statements issued outside the DAOs are named after the first caller outside SQLAlchemy.
+    """
+    frame = sys._getframe(2)
+    method = None
+    fallback = None
+    for _ in range(max_depth):
+        if frame is None:
+            break
+        code = frame.f_code
+        module = frame.f_globals.get('__name__', '')
+        if (module.startswith('sql.daos.') and code.co_argcount and code.co_varnames[0] == 'self'
+                and '<locals>' not in code.co_qualname):
+            method = f"{type(frame.f_locals['self']).__name__}.{code.co_name}"
+        elif fallback is None and not module.startswith(('sqlalchemy', 'pandas', __name__)):
+            fallback = f'{module}.{code.co_name}'
+        frame = frame.f_back
+    return method or fallback or 'unknown'
+
+
+class RerunStats:
+    """The statements run during one Streamlit rerun."""
+
+    def __init__(self, name: str = ''):
+        self.name = name
+        self.started = time.time()
+        self.queries: List[Tuple[str, float, int]] = []
+
+    def add(self, method: str, elapsed: float, rows: int):
+        self.queries.append((method, elapsed, rows))
+
+    def summary(self) -> 'pd.DataFrame':
+        """
+        Aggregate the statements by DAO method.
+
+        Returns:
+            DataFrame with metodo, query, totale_ms, max_ms and righe, slowest methods first
+        """
+        import pandas as pd
+
+        df = pd.DataFrame(self.queries, columns=['metodo', 'elapsed', 'righe'])
+        summary = df.groupby('metodo').agg(query=('elapsed', 'size'), totale_ms=('elapsed', 'sum'),
+                                           max_ms=('elapsed', 'max'), righe=('righe', 'sum')).reset_index()
+        summary[['totale_ms', 'max_ms']] = (summary[['totale_ms', 'max_ms']] * 1000).round(2)
+        return summary.sort_values('totale_ms', ascending=False)
+
+
+class QueryRecorder:
+    """Time the statements of an engine, per rerun of the current thread and in total."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.totals: Dict[str, Dict] = defaultdict(
+            lambda: dict(count=0, seconds=0.0, rows=0, buckets=[0] * len(LATENCY_BUCKETS)))
+
+    def install(self, engine: 'Engine'):
+        from sqlalchemy import event
+
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+        event.listen(engine, 'handle_error', self._handle_error)
+
+    def start_rerun(self, name: str = '') -> RerunStats:
+        """Collect the statements run from now on by the current thread in a new RerunStats."""
+        self._local.current = RerunStats(name)
+        return self._local.current
+
+    def _before_execute(self, connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+    def _after_execute(self, connection, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - connection.info['query_start_time'].pop()
+        rows = cursor.rowcount if cursor.description is not None and cursor.rowcount > 0 else 0
+        method = calling_method()
+        current: Optional[RerunStats] = getattr(self._local, 'current', None)
+        if current is not None:
+            current.add(method, elapsed, rows)
+        with self._lock:
+            totals = self.totals[method]
+            totals['count'] += 1
+            totals['seconds'] += elapsed
+            totals['rows'] += rows
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if elapsed <= bound:
+                    totals['buckets'][i] += 1
+
+    def _handle_error(self, context):
+        if context.connection is not None and context.connection.info.get('query_start_time'):
+            context.connection.info['query_start_time'].pop()
+
+    def prometheus_text(self) -> str:
+        """The SQL totals, with the pool and query cache metrics, in the Prometheus text format."""
+        from sql.cache import QUERY_CACHE
+        from sql.manager import DBInstance
+
+        lines = ['# HELP bash_sql_query_duration_seconds Latency of the SQL statements by DAO method',
+                 '# TYPE bash_sql_query_duration_seconds histogram']
+        with self._lock:
+            totals = {method: dict(values, buckets=list(values['buckets'])) for method, values in self.totals.items()}
+        for method, values in sorted(totals.items()):
+            label = f'method="{_escape(method)}"'
+            for bound, count in zip(LATENCY_BUCKETS, values['buckets']):
+                lines.append(f'bash_sql_query_duration_seconds_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'bash_sql_query_duration_seconds_bucket{{{label},le="+Inf"}} {values["count"]}')
+            lines.append(f'bash_sql_query_duration_seconds_sum{{{label}}} {values["seconds"]:.6f}')
+            lines.append(f'bash_sql_query_duration_seconds_count{{{label}}} {values["count"]}')
+        lines += ['# HELP bash_sql_rows_total Rows returned by the SQL statements by DAO method',
+                  '# TYPE bash_sql_rows_total counter']
+        lines += [f'bash_sql_rows_total{{method="{_escape(method)}"}} {values["rows"]}'
+                  for method, values in sorted(totals.items())]
+        for prefix, stats in (('bash_db_pool', DBInstance().pool_stats()), ('bash_query_cache', QUERY_CACHE.stats())):
+            for key, value in stats.items():
+                if key in COUNTERS:
+                    lines += [f'# TYPE {prefix}_{key}_total counter', f'{prefix}_{key}_total {value}']
+                else:
+                    lines += [f'# TYPE {prefix}_{key} gauge', f'{prefix}_{key} {value}']
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+RECORDER = QueryRecorder()
+
+
+def export_metrics():
+    """Write the Prometheus metrics to METRICS_FILE, if set."""
+    path = os.getenv('METRICS_FILE')
+    if not path:
+        return
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as f:
+        f.write(RECORDER.prometheus_text())
+    os.replace(temporary, path)
+
+
+def serve_metrics(port: int, host: str = '127.0.0.1') -> 'ThreadingHTTPServer':
+    """Serve the Prometheus metrics on http://host:port/metrics from a daemon thread, localhost only by default."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    from sql.utils import logger
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = RECORDER.prometheus_text().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logger.info(f'Serving SQL metrics on {host}:{port}')
+    return server
@@ -1,12 +1,74 @@
 import logging
 import os
+import threading
+import time
+from typing import Dict, Any
 
 from sqlalchemy import URL, create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import QueuePool
+
+from sql.instrumentation import RECORDER, diagnostics_enabled
 #
 # logging.basicConfig()
 # logging.getLogger('sqlalchemy.engine').setLevel(logging.INFO)
 
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    A QueuePool counting checkouts, overflow connections and timeouts, and measuring how
+    long threads wait to get a connection, including the time to open a new one.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._metrics_lock = threading.Lock()
+        self.checkouts = 0
+        self.overflow_events = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            with self._metrics_lock:
+                self.timeouts += 1
+            raise
+        waited = time.perf_counter() - start
+        with self._metrics_lock:
+            self.checkouts += 1
+            self.wait_time += waited
+            self.max_wait_time = max(self.max_wait_time, waited)
+        return connection
+
+    def _create_connection(self):
+        # The overflow counter is incremented before opening a connection beyond the pool size
+        if self.overflow() > 0:
+            with self._metrics_lock:
+                self.overflow_events += 1
+        return super()._create_connection()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._metrics_lock:
+            return dict(
+                pool_size=self.size(),
+                checked_out=self.checkedout(),
+                idle=self.checkedin(),
+                overflow=max(self.overflow(), 0),
+                max_overflow=self._max_overflow,
+                checkouts=self.checkouts,
+                overflow_events=self.overflow_events,
+                timeouts=self.timeouts,
+                wait_time_total_s=round(self.wait_time, 4),
+                wait_time_avg_ms=round(self.wait_time / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                wait_time_max_ms=round(self.max_wait_time * 1000, 3),
+            )
+
+
 class DBInstance:
     """A singleton class to manage database connections and session creation."""
 
@@ -22,6 +84,16 @@ class DBInstance:
     def __init__(self):
         """
         Initialize the database manager (only once).
+
+        The connection pool is configured with environment variables:
+            POSTGRES_HOST: Database host, defaults to localhost
+            DB_POOL_SIZE: Connections kept open in the pool, defaults to 5
+            DB_MAX_OVERFLOW: Connections opened beyond the pool size under load, defaults to 10
+            DB_POOL_TIMEOUT: Seconds to wait for a free connection before failing, defaults to 30
+            DB_POOL_RECYCLE: Seconds after which a connection is replaced, defaults to 1800
+            DB_POOL_PRE_PING: Test connections on checkout, defaults to true
+            DB_STATEMENT_TIMEOUT_MS: Per statement timeout in milliseconds, 0 (the default) disables it
+            SQL_DIAGNOSTICS: Time the statements by DAO method, see sql.instrumentation, defaults to false
         """
         if self._initialized:
             return
@@ -30,15 +102,41 @@ class DBInstance:
             "postgresql",
             username=os.getenv('POSTGRES_USER', ''),
             password=os.getenv('POSTGRES_PASSWORD', ''),
-            host='localhost',
+            host=os.getenv('POSTGRES_HOST', 'localhost'),
             port=os.getenv('POSTGRES_PORT', 5432),
             database=os.getenv('POSTGRES_DB'),
         )
-        self.engine = create_engine(url_object)
+        connect_args = {}
+        statement_timeout = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 0))
+        if statement_timeout:
+            connect_args['options'] = f'-c statement_timeout={statement_timeout}'
+        self.engine = create_engine(
+            url_object,
+            poolclass=InstrumentedQueuePool,
+            pool_size=int(os.getenv('DB_POOL_SIZE', 5)),
+            max_overflow=int(os.getenv('DB_MAX_OVERFLOW', 10)),
+            pool_timeout=float(os.getenv('DB_POOL_TIMEOUT', 30)),
+            pool_recycle=int(os.getenv('DB_POOL_RECYCLE', 1800)),
+            pool_pre_ping=os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes'),
+            connect_args=connect_args,
+        )
+        if diagnostics_enabled():
+            RECORDER.install(self.engine)
         self.SessionMaker = sessionmaker(bind=self.engine)
         # Mark as initialized to prevent re-initialization
         DBInstance._initialized = True
 
+    def pool_stats(self) -> Dict[str, Any]:
+        """
+        Get the live connection pool metrics.
+
+        Returns:
+            Dict with the pool size, the connections checked out, idle and in overflow, and the
+            number of checkouts, overflow connections opened and timeouts, with the time spent
+            waiting for a connection
+        """
+        return self.engine.pool.stats()
+
     @property
     def session(self) -> Session:
         """Get a new database session."""
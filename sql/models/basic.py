@@ -1,22 +1,46 @@
 from datetime import datetime
 from typing import Optional
 
-from sqlalchemy import DateTime, String, Float, ColumnElement
-from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy import DateTime, String, Float, ColumnElement, BigInteger, Identity, Computed
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import DeclarativeBase, declared_attr
 from sqlalchemy.orm import Mapped, mapped_column
 
 
 class Base(DeclarativeBase):
     pass
 
+def natural_key_hash(natural_key) -> str:
+    """
+    SQL expression hashing the natural key of an operation into a 16 bytes uuid. Timestamps are
+    hashed as epoch seconds and amounts rounded to cents, so that deduplication does not depend
+    on the float representation of the amounts.
+
+    Args:
+        natural_key: Pairs of column name and kind, one of 'timestamp', 'amount' or 'text'
+    """
+    formats = {'timestamp': 'extract(epoch from {})::text', 'amount': 'round({}::numeric, 2)::text', 'text': '{}'}
+    parts = " || '|' || ".join(formats[kind].format(column) for column, kind in natural_key)
+    return f'md5({parts})::uuid'
+
+
 class OperationBase(Base):
     """Base class with common timestamp fields."""
     __abstract__ = True
-    data_operazione: Mapped[DateTime] = mapped_column(DateTime, nullable=False, index=True, primary_key=True)
+    # Columns identifying an operation, hashed into row_hash
+    natural_key = (('data_operazione', 'timestamp'), ('importo', 'amount'))
+
+    id: Mapped[int] = mapped_column(BigInteger, Identity(), primary_key=True)
+    data_operazione: Mapped[DateTime] = mapped_column(DateTime, nullable=False, index=True)
     data_valuta: Mapped[Optional[DateTime]] = mapped_column(DateTime)
-    importo: Mapped[float] = mapped_column(Float, default=0, primary_key=True)
+    importo: Mapped[float] = mapped_column(Float, default=0)
     descrizione: Mapped[Optional[str]] = mapped_column(String)
 
+    @declared_attr
+    def row_hash(cls) -> Mapped[str]:
+        return mapped_column(UUID(as_uuid=False), Computed(natural_key_hash(cls.natural_key), persisted=True),
+                             unique=True)
+
     @classmethod
     def in_timerange(cls, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None):
         start_date = start_date or datetime.min
@@ -1,9 +1,12 @@
+import re
 from enum import Enum
+from typing import Optional
 
-from sqlalchemy import String, func, ColumnElement, or_
+import pandas as pd
+from sqlalchemy import String, Integer, Index, func, ColumnElement, or_, case, false
 from sqlalchemy.orm import Mapped, mapped_column
 
-from sql.models.basic import OperationBase
+from sql.models.basic import Base, OperationBase
 
 
 class MovimentiCategory(Enum):
@@ -36,8 +39,11 @@ category_map = {
 class MovimentiModel(OperationBase):
     """SQLAlchemy model for the movimenti table."""
     __tablename__ = 'movimenti'
+    __table_args__ = (Index('ix_movimenti_categoria_data', 'categoria', 'data_operazione'),)
+    natural_key = OperationBase.natural_key + (('descrizione_completa', 'text'),)
 
-    descrizione_completa: Mapped[str] = mapped_column(String, primary_key=True)
+    descrizione_completa: Mapped[str] = mapped_column(String)
+    categoria: Mapped[Optional[str]] = mapped_column(String)
 
     def __repr__(self):
         return f"<Movimento(data='{self.data_operazione}', importo={self.importo}, descrizione={self.descrizione})>"
@@ -45,18 +51,65 @@ class MovimentiModel(OperationBase):
     @classmethod
     def is_category(cls, category: MovimentiCategory) -> ColumnElement[bool]:
         """Filter by movement category."""
-        if category == MovimentiCategory.AltriMovimenti:
-            return ~or_(
-                cls.is_category(MovimentiCategory.Bonifici),
-                cls.is_category(MovimentiCategory.CompravenditaTitoli),
-                cls.is_category(MovimentiCategory.Tasse),
-                cls.is_category(MovimentiCategory.Dividendi),
-                cls.is_category(MovimentiCategory.Interessi),
-                cls.is_category(MovimentiCategory.SpeseConto),
-            )
+        return cls.categoria == category.value
+
+    @classmethod
+    def matches_rules(cls, category: MovimentiCategory) -> ColumnElement[bool]:
+        """Check the description against the category_map keywords of a category."""
         keywords = category_map.get(category, [])
         if not keywords:
-            return False
+            return false()
 
         conditions = [func.lower(cls.descrizione).like(f'%{kw}%') for kw in keywords]
         return or_(*conditions)
+
+    @classmethod
+    def classify(cls) -> ColumnElement[str]:
+        """Classify the movement into its category, checking categories in category_map order."""
+        return case(*[(cls.matches_rules(category), category.value) for category in category_map],
+                    else_=MovimentiCategory.AltriMovimenti.value)
+
+    @classmethod
+    def sign(cls) -> ColumnElement[str]:
+        """Label the movement as 'entrata' or 'uscita'."""
+        return case((cls.is_entrata(), 'entrata'), (cls.is_uscita(), 'uscita'))
+
+
+class RegoleCategorieModel(Base):
+    """SQLAlchemy model for the category rules last applied to the movimenti table."""
+    __tablename__ = 'regole_categorie'
+
+    categoria: Mapped[str] = mapped_column(String, primary_key=True)
+    keyword: Mapped[str] = mapped_column(String, primary_key=True)
+    priorita: Mapped[int] = mapped_column(Integer)
+
+    def __repr__(self):
+        return f"<RegolaCategoria(categoria={self.categoria}, keyword='{self.keyword}', priorita={self.priorita})>"
+
+
+_category_patterns = [(category, re.compile('|'.join(re.escape(kw) for kw in keywords)))
+                      for category, keywords in category_map.items()]
+
+
+def _match_category(descrizione: str) -> str:
+    for category, pattern in _category_patterns:
+        if pattern.search(descrizione):
+            return category.value
+    return MovimentiCategory.AltriMovimenti.value
+
+
+def classify_descrizioni(descrizioni: pd.Series) -> pd.Series:
+    """
+    Assign a category to each description with the category_map rules, consistently
+    with MovimentiModel.classify. Descriptions repeat a lot, so every distinct
+    description is matched only once.
+
+    Args:
+        descrizioni: Series of movement descriptions
+
+    Returns:
+        Series of category values with the same index
+    """
+    lowered = descrizioni.fillna('').astype(str).str.lower()
+    categories = {descrizione: _match_category(descrizione) for descrizione in lowered.unique()}
+    return lowered.map(categories)
@@ -9,17 +9,18 @@ from sql.models.basic import OperationBase
 class OrdiniModel(OperationBase):
     """SQLAlchemy model for the ordini table."""
     __tablename__ = 'ordini'
+    natural_key = OperationBase.natural_key + (('isin', 'text'), ('controvalore', 'amount'))
 
-    isin: Mapped[str] = mapped_column(String, ForeignKey("titoli.isin"), nullable=False, index=True, primary_key=True)
+    isin: Mapped[str] = mapped_column(String, ForeignKey("titoli.isin"), nullable=False, index=True)
     segno: Mapped[Optional[str]] = mapped_column(String)
     quantita: Mapped[Optional[float]] = mapped_column(Float)
     divisa: Mapped[Optional[str]] = mapped_column(String)
     prezzo: Mapped[Optional[float]] = mapped_column(Float)
     cambio: Mapped[Optional[float]] = mapped_column(Float)
-    controvalore: Mapped[float] = mapped_column(Float, primary_key=True)
+    controvalore: Mapped[float] = mapped_column(Float)
     commissione: Mapped[float] = mapped_column(Float, default=0)
     tipo_commissione: Mapped[Optional[str]] = mapped_column(String)
-    importo: Mapped[float] = mapped_column(Float, default=0, primary_key=True)
+    importo: Mapped[float] = mapped_column(Float, default=0)
 
     # Relationship to titolo
     titolo_info: Mapped["TitoliModel"] = relationship(
@@ -43,4 +44,8 @@ class OrdiniModel(OperationBase):
             "commissione": self.commissione,
             "tipo_commissione": self.tipo_commissione,
             "importo": self.importo
-        }
\ No newline at end of file
+        }
+
+
+# titolo_info names TitoliModel: import it so the mapper resolves it even when only ordini is used
+import sql.models.titoli  # noqa: E402,F401
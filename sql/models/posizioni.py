@@ -0,0 +1,25 @@
+from sqlalchemy import String, Float, Integer, ForeignKey
+from sqlalchemy.orm import Mapped, mapped_column
+
+from sql.models.basic import Base
+
+
+class PosizioniModel(Base):
+    """SQLAlchemy model for the posizioni table, holding the running order totals of each isin."""
+    __tablename__ = 'posizioni'
+
+    isin: Mapped[str] = mapped_column(String, ForeignKey("titoli.isin"), primary_key=True)
+    quantita_comprata: Mapped[float] = mapped_column(Float, default=0)
+    costo_acquisti: Mapped[float] = mapped_column(Float, default=0)
+    quantita_venduta: Mapped[float] = mapped_column(Float, default=0)
+    ricavo_vendite: Mapped[float] = mapped_column(Float, default=0)
+    incassi_vendite: Mapped[float] = mapped_column(Float, default=0)
+    incassi_dividendi: Mapped[float] = mapped_column(Float, default=0)
+    commissioni: Mapped[float] = mapped_column(Float, default=0)
+    numero_ordini: Mapped[int] = mapped_column(Integer, default=0)
+
+    TOTALS = ('quantita_comprata', 'costo_acquisti', 'quantita_venduta', 'ricavo_vendite',
+              'incassi_vendite', 'incassi_dividendi', 'commissioni')
+
+    def __repr__(self):
+        return f"<Posizione(isin={self.isin}, quantita={self.quantita_comprata - self.quantita_venduta})>"
@@ -0,0 +1,19 @@
+from datetime import date
+
+from sqlalchemy import Date, Float
+from sqlalchemy.orm import Mapped, mapped_column
+
+from sql.models.basic import Base
+
+
+class SaldiModel(Base):
+    """SQLAlchemy model for the saldi_giornalieri table, the end of day balances."""
+    __tablename__ = 'saldi_giornalieri'
+
+    data: Mapped[date] = mapped_column(Date, primary_key=True)
+    liquidita: Mapped[float] = mapped_column(Float, default=0)
+    investimenti: Mapped[float] = mapped_column(Float, default=0)
+    totale: Mapped[float] = mapped_column(Float, default=0)
+
+    def __repr__(self):
+        return f"<Saldo(data='{self.data}', liquidita={self.liquidita}, investimenti={self.investimenti})>"
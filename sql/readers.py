@@ -0,0 +1,115 @@
+import io
+from typing import Dict
+
+import pandas as pd
+import pyarrow as pa
+from pyarrow import csv
+from sqlalchemy import Boolean, Date, DateTime, Float, Integer, String, Uuid, cast
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine import Engine
+
+from sql.utils import logger
+
+try:
+    import adbc_driver_postgresql.dbapi as adbc
+except ImportError:
+    adbc = None
+
+ARROW_TYPES = ((DateTime, pa.timestamp('us')), (Date, pa.date32()), (Float, pa.float64()),
+               (Integer, pa.int64()), (Boolean, pa.bool_()), (String, pa.string()))
+
+
+def compile_query(stmt) -> str:
+    """Render a select as Postgres SQL with its parameters inlined."""
+    return str(stmt.compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True}))
+
+
+def _uuid_as_text(stmt):
+    """
+    Cast the uuid columns of a select to text, as pd.read_sql returns them: ADBC would decode
+    them to 16 bytes values.
+    """
+    columns = list(stmt.selected_columns)
+    if not any(isinstance(column.type, Uuid) for column in columns):
+        return stmt
+    return stmt.with_only_columns(
+        *[cast(column, String).label(column.key) if isinstance(column.type, Uuid) else column for column in columns],
+        maintain_column_froms=True)
+
+
+def _arrow_schema(stmt) -> Dict[str, pa.DataType]:
+    schema = {}
+    for column in stmt.selected_columns:
+        for sql_type, arrow_type in ARROW_TYPES:
+            if isinstance(column.type, sql_type):
+                schema[column.key] = arrow_type
+                break
+    return schema
+
+
+def read_copy(stmt, engine: Engine) -> pd.DataFrame:
+    """
+    Read the result of a select streaming it with COPY ... TO STDOUT and parsing the CSV
+    with the multithreaded Arrow reader, typed after the selected columns.
+
+    Args:
+        stmt: The select to run
+        engine: Engine of the database
+
+    Returns:
+        The result as a DataFrame
+    """
+    stmt = _uuid_as_text(stmt)
+    buffer = io.BytesIO()
+    with engine.connect() as connection:
+        cursor = connection.connection.cursor()
+        cursor.copy_expert(f"COPY ({compile_query(stmt)}) TO STDOUT WITH (FORMAT csv, HEADER, NULL '\\N')", buffer)
+    buffer.seek(0)
+    table = csv.read_csv(buffer, convert_options=csv.ConvertOptions(
+        column_types=_arrow_schema(stmt), null_values=['\\N'], strings_can_be_null=True))
+    return table.to_pandas(coerce_temporal_nanoseconds=True)
+
+
+def read_arrow(stmt, engine: Engine) -> pd.DataFrame:
+    """
+    Read the result of a select with the ADBC Postgres driver, which decodes the binary
+    COPY stream straight into Arrow columns. Falls back to read_copy without the driver.
+
+    Args:
+        stmt: The select to run
+        engine: Engine of the database, its URL is used to open the ADBC connection
+
+    Returns:
+        The result as a DataFrame
+    """
+    if adbc is None:
+        logger.warning('adbc-driver-postgresql is not installed, reading with COPY')
+        return read_copy(stmt, engine)
+    stmt = _uuid_as_text(stmt)
+    uri = engine.url.set(drivername='postgresql').render_as_string(hide_password=False)
+    with adbc.connect(uri) as connection, connection.cursor() as cursor:
+        cursor.execute(compile_query(stmt))
+        table = cursor.fetch_arrow_table()
+    # Postgres integer columns are decoded to int32, read_sql and read_copy return int64
+    schema = _arrow_schema(stmt)
+    table = table.cast(pa.schema([field.with_type(schema.get(field.name, field.type)) for field in table.schema]))
+    return table.to_pandas(coerce_temporal_nanoseconds=True)
+
+
+if __name__ == '__main__':
+    # Parity check of the COPY and Arrow readers against pd.read_sql on every table
+    from sql import dao_list
+
+    mismatches = 0
+    for name in dao_list.DAOS:
+        dao = getattr(dao_list, name)
+        expected = dao.get_all(as_dataframe=True)
+        for reader in ('copy', 'arrow'):
+            try:
+                pd.testing.assert_frame_equal(expected, dao.get_all(as_dataframe=True, reader=reader))
+                print(f'{dao.table_name} {reader}: ok')
+            except AssertionError as e:
+                mismatches += 1
+                print(f'{dao.table_name} {reader}: MISMATCH {e}')
+    if mismatches:
+        raise SystemExit(1)
@@ -0,0 +1,70 @@
+"""
+Create the tables of the DAOs and migrate older schemas, once per database rather than at
+every page import.
+
+Run from the repository root before starting the dashboard, run.sh does it:
+    python -m sql.schema
+"""
+import time
+
+from sqlalchemy import text
+
+from sql import dao_list
+from sql.manager import DBInstance
+from sql.utils import logger
+
+# In dependency order: ordini reference titoli
+SCHEMA_DAOS = ('TITOLI_DAO', 'ORDINI_DAO', 'MOVIMENTI_DAO', 'POSIZIONI_DAO', 'SALDI_DAO')
+
+# Every statement writing a table bumps its version in the same transaction, whichever
+# process runs it: sql.cache reads them to invalidate the results of the other processes
+VERSIONS_DDL = (
+    """
+    CREATE TABLE IF NOT EXISTS versioni_tabelle (
+        tabella VARCHAR PRIMARY KEY,
+        versione BIGINT NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE OR REPLACE FUNCTION bump_versione_tabella() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO versioni_tabelle (tabella, versione) VALUES (TG_TABLE_NAME, 1)
+        ON CONFLICT (tabella) DO UPDATE SET versione = versioni_tabelle.versione + 1;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+)
+VERSION_TRIGGER = """
+    CREATE OR REPLACE TRIGGER versione_{table}
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_versione_tabella()
+"""
+
+
+def create_version_triggers(tables):
+    """
+    Create the versioni_tabelle table and the triggers bumping the version of the given tables.
+
+    Args:
+        tables: Names of the tables to track
+    """
+    with DBInstance().engine.begin() as connection:
+        for statement in VERSIONS_DDL:
+            connection.execute(text(statement))
+        for table in tables:
+            connection.execute(text(VERSION_TRIGGER.format(table=table)))
+
+
+def create_schema():
+    """Create the missing tables, columns and indexes of all the DAOs. Safe to run again."""
+    start = time.perf_counter()
+    daos = [getattr(dao_list, name) for name in SCHEMA_DAOS]
+    for dao in daos:
+        dao.create_table()
+    create_version_triggers([dao.table_name for dao in daos])
+    logger.info(f'Schema ready in {time.perf_counter() - start:.2f}s')
+
+
+if __name__ == '__main__':
+    create_schema()
@@ -0,0 +1,92 @@
+"""
+Snapshot the uploaded tables to Parquet and restore them, instead of uploading every
+Fineco export again.
+
+Run from the repository root:
+    python -m sql.snapshot export snapshots/2025-06
+    python -m sql.snapshot import snapshots/2025-06
+"""
+import argparse
+import shutil
+import time
+from pathlib import Path
+from typing import Dict
+
+import pandas as pd
+
+from sql.dao_list import TITOLI_DAO, ORDINI_DAO, MOVIMENTI_DAO
+from sql.schema import create_schema
+from sql.utils import logger
+
+# In dependency order: ordini reference titoli
+SNAPSHOT_DAOS = (TITOLI_DAO, ORDINI_DAO, MOVIMENTI_DAO)
+PARTITION_COLUMN = 'anno'
+
+
+def export_snapshot(path: str, compression: str = 'zstd') -> Dict[str, int]:
+    """
+    Dump titoli, ordini and movimenti to Parquet, one directory per table. Tables with
+    operations are partitioned by year of data_operazione.
+
+    Args:
+        path: Directory of the snapshot, the tables already in it are replaced
+        compression: Parquet compression codec
+
+    Returns:
+        Number of rows exported per table
+    """
+    exported = {}
+    for dao in SNAPSHOT_DAOS:
+        df = dao.get_all(as_dataframe=True, reader='copy')
+        target = Path(path) / dao.table_name
+        shutil.rmtree(target, ignore_errors=True)
+        target.mkdir(parents=True)
+        if 'data_operazione' in df.columns:
+            df[PARTITION_COLUMN] = df['data_operazione'].dt.year
+            df.to_parquet(target, engine='pyarrow', compression=compression,
+                          partition_cols=[PARTITION_COLUMN], index=False)
+        else:
+            df.to_parquet(target / f'{dao.table_name}.parquet', engine='pyarrow',
+                          compression=compression, index=False)
+        exported[dao.table_name] = len(df)
+        logger.info(f'Exported {len(df)} rows of {dao.table_name} to {target}')
+    return exported
+
+
+def import_snapshot(path: str) -> Dict[str, Dict]:
+    """
+    Load a snapshot written by export_snapshot with the bulk COPY insert. Rows already
+    present are skipped, so a snapshot can be loaded on top of existing data.
+
+    Args:
+        path: Directory of the snapshot
+
+    Returns:
+        The insert results per table
+    """
+    imported = {}
+    for dao in SNAPSHOT_DAOS:
+        source = Path(path) / dao.table_name
+        if not source.exists():
+            logger.warning(f'No {dao.table_name} in snapshot {path}, skipping')
+            continue
+        df = pd.read_parquet(source, engine='pyarrow')
+        df = df.drop(columns=[PARTITION_COLUMN], errors='ignore')
+        imported[dao.table_name] = dao.insert_dataframe(df, method='copy')
+        logger.info(f'Imported {imported[dao.table_name]["success_count"]} rows of {dao.table_name} from {source}')
+    return imported
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['export', 'import'])
+    parser.add_argument('path')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == 'export':
+        export_snapshot(args.path)
+    else:
+        create_schema()
+        import_snapshot(args.path)
+    logger.info(f'Snapshot {args.command} took {time.perf_counter() - start:.2f}s')
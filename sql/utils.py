@@ -1,7 +1,11 @@
+import csv
+import io
 import logging
 from datetime import datetime
-from typing import Optional, Any
+from itertools import islice
+from typing import Optional, Any, List, Dict, Iterator
 import pandas as pd
+from sqlalchemy import Table, DateTime, Float, Integer, String
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -87,40 +91,205 @@ def ensure_datetime(date_var: Any, date_format: str = '%d/%m/%Y') -> datetime:
         raise TypeError(f"Unsupported date type '{type(date_var)}' for value '{date_var}': {e}")
 
 
-def read_excel_file(file_path: str, **kwargs) -> pd.DataFrame:
+def coerce_dataframe(df: pd.DataFrame, table: Table) -> pd.DataFrame:
+    """
+    Validate a dataframe against the columns of a table and convert each column,
+    as a whole, to the dtype matching the column type.
+
+    Args:
+        df: DataFrame with columns named as the table columns
+        table: The SQLAlchemy table the rows are meant for
+
+    Returns:
+        DataFrame restricted to the table columns, with datetime64, float64 and object dtypes
+    """
+    unknown = set(df.columns) - set(table.columns.keys())
+    if unknown:
+        logger.warning(f'Ignoring columns {sorted(unknown)} not present in {table.name}')
+
+    data = {}
+    for column in table.columns:
+        if column.name not in df.columns:
+            continue
+        values = df[column.name]
+        if isinstance(column.type, DateTime):
+            values = pd.to_datetime(values, dayfirst=True)
+        elif isinstance(column.type, (Float, Integer)):
+            values = pd.to_numeric(values, errors='coerce')
+        elif isinstance(column.type, String):
+            values = values.astype(object)
+        data[column.name] = values
+    return pd.DataFrame(data, index=df.index)
+
+
+def dataframe_to_params(df: pd.DataFrame, table: Table) -> List[Dict]:
+    """
+    Convert a dataframe to a list of parameter dictionaries for a Core insert executemany.
+    Missing values (NaN, NaT, None) are converted to NULL.
+
+    Args:
+        df: DataFrame with columns named as the table columns
+        table: The SQLAlchemy table the rows are meant for
+
+    Returns:
+        List of dictionaries, one per row
+    """
+    df = coerce_dataframe(df, table)
+    names = list(df.columns)
+    columns = [df[name].astype(object).where(df[name].notna(), None).tolist() for name in names]
+    return [dict(zip(names, row)) for row in zip(*columns)]
+
+
+HEADER_SNIFF_ROWS = 50
+EXCEL_MAGIC = {b'PK\x03\x04': 'openpyxl', b'\xd0\xcf\x11\xe0': 'xlrd'}
+
+
+def _rewind(source):
+    if hasattr(source, 'seek'):
+        source.seek(0)
+
+
+def detect_excel_engine(source) -> Optional[str]:
+    """
+    Detect the format of a file from its first bytes.
+
+    Args:
+        source: Path or file-like object
+
+    Returns:
+        'openpyxl' for xlsx files, 'xlrd' for xls files, None for text files
+    """
+    if hasattr(source, 'read'):
+        _rewind(source)
+        magic = source.read(4)
+        _rewind(source)
+    else:
+        with open(source, 'rb') as f:
+            magic = f.read(4)
+    return EXCEL_MAGIC.get(magic)
+
+
+def read_excel_file(file_path, **kwargs) -> Optional[pd.DataFrame]:
+    engine = detect_excel_engine(file_path)
+    _rewind(file_path)
     try:
-        df = pd.read_csv(file_path, encoding='utf-8', **kwargs)
+        if engine is None:
+            return pd.read_csv(file_path, encoding='utf-8', **kwargs)
+        return pd.read_excel(file_path, engine=engine, **kwargs)
     except Exception as e:
-        try:
-            df = pd.read_excel(file_path, engine='openpyxl', **kwargs)
-        except Exception as e:
-            # Try with xlrd engine for older Excel files
-            try:
-                df = pd.read_excel(file_path, engine='xlrd', **kwargs)
-            except Exception as e2:
-                logging.error(
-                    f"Could not read Excel file with any engine. Original errors: openpyxl: {e}, xlrd: {e2}")
-                return None
+        logging.error(f"Could not read file with {engine or 'csv'} reader: {e}")
+        return None
+
+
+def find_header_row(file_path, sniff_rows: int = HEADER_SNIFF_ROWS) -> int:
+    """
+    Find the header of an export looking only at its first rows: the header is the first
+    row with a value in every column, the rows above it are titles and notes.
+
+    Args:
+        file_path: Path or file-like object
+        sniff_rows: Number of rows to look at
+
+    Returns:
+        Position of the header row, 0 if no row is complete
+    """
+    if detect_excel_engine(file_path) is None:
+        return _find_csv_header_row(file_path, sniff_rows)
+    head = read_excel_file(file_path, header=None, nrows=sniff_rows)
+    if head is None or head.empty:
+        return 0
+    complete = head.notna().all(axis=1)
+    return int(complete.values.argmax()) if complete.any() else 0
+
+
+def _find_csv_header_row(file_path, sniff_rows: int) -> int:
+    # Title rows have fewer fields than the table, so the csv module is used instead of read_csv
+    _rewind(file_path)
+    if hasattr(file_path, 'read'):
+        text = io.TextIOWrapper(file_path, encoding='utf-8', newline='')
+    else:
+        text = open(file_path, encoding='utf-8', newline='')
+    try:
+        rows = list(islice(csv.reader(text), sniff_rows))
+    finally:
+        if hasattr(file_path, 'read'):
+            text.detach()
+        else:
+            text.close()
+        _rewind(file_path)
+    width = max((len(row) for row in rows), default=0)
+    for idx, row in enumerate(rows):
+        if len(row) == width and all(cell.strip() for cell in row):
+            return idx
+    return 0
+
+
+def _clean_table(df: pd.DataFrame) -> pd.DataFrame:
+    # Remove any completely empty rows
+    df = df.dropna(how='all')
+    # Clean column names (remove any extra whitespace)
+    df.columns = df.columns.astype(str).str.strip()
     return df
 
 
 def convert_file_to_table(file_path) -> Optional[pd.DataFrame]:
-    df = read_excel_file(file_path, header=None)
-    if df is not None:
-        num_cols = len(df.columns)
-        idx = 0
-        # Analyze each row
-        for idx, row in df.iterrows():
-            non_null = row.notna().sum()
-            if non_null == num_cols:
-                break
-        df = read_excel_file(file_path, skiprows=idx, parse_dates=True, date_format='%d/%m/%Y')
-        if df is not None:
-            # Remove any completely empty rows
-            df = df.dropna(how='all')
-
-            # Clean column names (remove any extra whitespace)
-            df.columns = df.columns.str.strip()
-            return df
-    return None
+    """
+    Read an export into a DataFrame, skipping the rows above the header.
+
+    Args:
+        file_path: Path or file-like object of a csv, xls or xlsx file
+
+    Returns:
+        The table, None if the file cannot be read
+    """
+    header = find_header_row(file_path)
+    df = read_excel_file(file_path, skiprows=header)
+    return None if df is None else _clean_table(df)
+
+
+def _iter_xlsx_rows(file_path, header: int):
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        for _ in range(header):
+            next(rows, None)
+        yield from rows
+    finally:
+        workbook.close()
 
+
+def iter_file_chunks(file_path, chunksize: int = 50000) -> Iterator[pd.DataFrame]:
+    """
+    Read an export chunk by chunk, so that large files can be ingested without holding the
+    whole sheet in memory. xls files cannot be streamed and are read at once.
+
+    Args:
+        file_path: Path or file-like object of a csv, xls or xlsx file
+        chunksize: Number of rows of each chunk
+
+    Returns:
+        Iterator over the chunks of the table, with the same columns as convert_file_to_table
+    """
+    header = find_header_row(file_path)
+    engine = detect_excel_engine(file_path)
+    _rewind(file_path)
+    if engine is None:
+        for chunk in pd.read_csv(file_path, encoding='utf-8', skiprows=header, chunksize=chunksize):
+            yield _clean_table(chunk)
+    elif engine == 'openpyxl':
+        rows = _iter_xlsx_rows(file_path, header)
+        names = next(rows, None)
+        if names is None:
+            return
+        columns = [f'Unnamed: {i}' if name is None else name for i, name in enumerate(names)]
+        while chunk := list(islice(rows, chunksize)):
+            yield _clean_table(pd.DataFrame(chunk, columns=columns))
+    else:
+        df = read_excel_file(file_path, skiprows=header)
+        if df is None:
+            raise ValueError('Could not convert file to table')
+        df = _clean_table(df)
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]